@@ -1,14 +1,19 @@
 from flask import Flask, render_template, request, redirect, url_for, session, g
 from core import core
 from functions.fingerprint import fp
+from functions.hardware_arbiter import HardwareBusy
+from functions.motion_profiles import PROFILES
+from functions.drive_modes import DRIVE_MODES
+from functions.dose_scheduler import DoseScheduler
+from functions import dose_events, recurrence
+from functions.db import ConnectionPool
 import json
 import os
 import hashlib
 import time
-import sqlite3
 import subprocess
 import threading
-from datetime import datetime
+from datetime import datetime, timedelta
 
 IDLE_LIMIT = 900  # 15 minutes (in seconds)
 
@@ -30,12 +35,14 @@ CREDENTIALS_FILE = "data/credentials.json"
 # Ensure data directory exists
 os.makedirs("data", exist_ok=True)
 
+# Long-lived, tuned connections shared by routes and the scheduler (WAL etc.)
+db_pool = ConnectionPool(DATABASE)
+
 # 🔹 Database Connection Function
 def get_db():
     db = getattr(g, "_database", None)
     if db is None:
-        db = g._database = sqlite3.connect(DATABASE)
-        db.row_factory = sqlite3.Row  # Allows dictionary-like access to rows
+        db = g._database = db_pool.acquire()  # rows allow dictionary-like access
     return db
 
 
@@ -80,67 +87,60 @@ def save_credentials(username, password):
 def close_connection(exception):
     db = getattr(g, "_database", None)
     if db is not None:
-        db.close()
-
-def check_medication_schedule():
-    print("🔄 Background alert system started...")
-
-    with app.app_context():  # Ensures Flask context for DB access
-        while True:
-            try:
-                # Current time as string and datetime
-                now_str = datetime.now().strftime("%H:%M")
-                now_dt = datetime.strptime(now_str, "%H:%M")
-                print(f"⏳ Checking for scheduled medications at {now_str}")
+        db_pool.release()  # back to the pool, not closed
+
+# 🔹 Dose events: one row per dose per day (see functions/dose_events.py)
+def init_dose_events():
+    with db_pool.connection() as db:
+        dose_events.ensure_schema(db)
+        # The old scheduler retired a prescription as 'Dispensed' after its
+        # first alarm; dose state now lives in dose_events
+        db.execute("UPDATE prescriptions SET status = 'Active' WHERE status = 'Dispensed'")
+        db.commit()
+        dose_events.roll_over(db)
 
-                # Open a database connection
-                db = sqlite3.connect("data/pillsync.db")
-                db.row_factory = sqlite3.Row  # Allows dictionary-like row access
 
-                # TODO: adjust status filter if your schema uses a different value
-                medications = db.execute(
-                    "SELECT prescription_id, name, time_of_day "
-                    "FROM prescriptions "
-                    "WHERE status = 'Active'"
-                ).fetchall()
+def roll_over_dose_events(now):
+    """Midnight: generate the next day's doses, close out missed ones."""
+    with db_pool.connection() as db:
+        dose_events.roll_over(db, now)
 
-                triggered = False  # Track if any alert should trigger
 
-                for med in medications:
-                    med_time_str = med["time_of_day"]
-                    med_time_dt = datetime.strptime(med_time_str, "%H:%M")
-                    time_difference = abs((now_dt - med_time_dt).total_seconds() / 60)
+# 🔹 Medication scheduler: sleeps until the next dose (see functions/dose_scheduler.py)
+def load_scheduled_doses():
+    """Pending doses for the scheduler heap (pooled connection: runs off-request)."""
+    with db_pool.connection() as db:
+        now = datetime.now()
+        dose_events.mark_missed(db, now)
+        rows = dose_events.due_between(
+            db, now - dose_events.WINDOW, now + timedelta(days=dose_events.HORIZON_DAYS)
+        )
+        return [dict(r) for r in rows]
 
-                    print(
-                        f"🧐 Checking medication: {med['name']} "
-                        f"scheduled for {med_time_str} (Δ={time_difference:.1f} min)"
-                    )
 
-                    if time_difference <= 15:
-                        print(f"✅ Triggering alert for {med['name']} at {now_str}")
+def on_doses_due(due):
+    """Every dose due at one wake-up -> one alarm episode."""
+    # 🔹 pending -> alerted, so a reload does not fire them again
+    with db_pool.connection() as db:
+        dose_events.mark(db, [d["event_id"] for d in due], dose_events.ALERTED)
 
-                        # 🔔 Use core.py to run real alarms (piezo + neopixel)
-                        core.trigger_alarms(duration=30.0)
-                        triggered = True
+    names = ", ".join(d["name"] for d in due)
+    print(f"✅ Triggering alert for {names} at {datetime.now().strftime('%H:%M')}")
 
-                        # 🔹 Mark the medication as "Dispensed" so it does not trigger again
-                        db.execute(
-                            "UPDATE prescriptions "
-                            "SET status = ?, last_dispensed = ? "
-                            "WHERE prescription_id = ?",
-                            ("Dispensed", datetime.now().isoformat(timespec="seconds"), med["prescription_id"]),
-                        )
-                        db.commit()
+    # 🔔 One alarm for all of them (extends a running one)
+    core.trigger_dose_alarm(due, duration=30.0)
 
-                if not triggered:
-                    print("❌ No medications matched the time window.")
 
-                db.close()  # Close database connection
-                time.sleep(60)  # Check every 60 seconds
+try:
+    init_dose_events()
+except Exception as e:
+    print(f"⚠ ERROR preparing dose events: {e}")
 
-            except Exception as e:
-                print(f"⚠ ERROR in background thread: {e}")
-                time.sleep(10)  # Prevent the thread from dying immediately
+dose_scheduler = DoseScheduler(
+    load=load_scheduled_doses,
+    on_due=on_doses_due,
+    roll_over=roll_over_dose_events,
+)
 
 
 @app.route("/", methods=["GET", "POST"])
@@ -272,11 +272,24 @@ def dashboard():
         (session["user_id"],)
     ).fetchone()
 
-    prescriptions = db.execute(
-        "SELECT name, dosage, time_of_day FROM prescriptions WHERE status='Active' AND user_id = ?",
+    rows = db.execute(
+        "SELECT * FROM prescriptions WHERE status='Active' AND user_id = ?",
         (session["user_id"],)
     ).fetchall()
 
+    # Soonest dose first
+    now = datetime.now()
+    prescriptions = []
+    for p in rows:
+        next_dose = recurrence.for_prescription(p).next_after(now, inclusive=True)
+        prescriptions.append({
+            "name": p["name"],
+            "dosage": p["dosage"],
+            "time_of_day": p["time_of_day"],
+            "next_dose": next_dose,
+        })
+    prescriptions.sort(key=lambda p: (p["next_dose"] is None, p["next_dose"] or now))
+
     return render_template(
         "dashboard.html",
         user_name=user["name"] if user else "User",
@@ -435,6 +448,9 @@ def delete_user(user_id):
     try:
         db.execute("DELETE FROM users WHERE user_id = ?;", (user_id,))
         db.commit()
+        # foreign_keys=ON: their prescriptions (and doses) went with them
+        dose_events.open_doses.invalidate()
+        dose_scheduler.notify()
         print(f"[INFO] User deleted: {user_id}")
     except Exception as e:
         print(f"[ERROR] delete_user failed: {e}")
@@ -479,6 +495,18 @@ def get_prescriptions():
     if request.args.get("format") == "json":
         cursor = db.execute("SELECT * FROM prescriptions")
         prescriptions = cursor.fetchall()
+        now = datetime.now()
+
+        def next_dose(p):
+            if p["status"] != "Active":
+                return None
+            due = recurrence.for_prescription(p).next_after(now, inclusive=True)
+            return dose_events.fmt(due) if due else None
+
+        def schedule_error(p):
+            schedule = recurrence.for_prescription(p)
+            return None if schedule.recognized else schedule.reason
+
         return [
             {
                 "prescription_id": p["prescription_id"],
@@ -490,6 +518,8 @@ def get_prescriptions():
                 "dosage": p["dosage"],
                 "time_of_day": p["time_of_day"],
                 "status": p["status"],
+                "next_dose": next_dose(p),
+                "schedule_error": schedule_error(p),
             }
             for p in prescriptions
         ]
@@ -512,10 +542,18 @@ def get_prescriptions():
     cur = db.execute(sql, params)
     prescriptions = cur.fetchall()
 
+    # Rows saved before frequencies were validated may have no schedule
+    schedule_errors = {}
+    for p in prescriptions:
+        schedule = recurrence.for_prescription(p)
+        if not schedule.recognized:
+            schedule_errors[p["prescription_id"]] = schedule.reason
+
     return render_template(
         "prescriptions.html",
         prescriptions=prescriptions,
         selected_user_id=selected_user_id,
+        schedule_errors=schedule_errors,
     )
 
 
@@ -542,7 +580,18 @@ def add_prescription():
             print("[ERROR] Missing required fields in Add Prescription")
             return redirect(url_for("add_prescription", user_id=user_id))
 
-        db.execute(
+        # Refuse schedules the dose generator can't expand (no silent daily fallback)
+        schedule = recurrence.parse(frequency, time_of_day)
+        if not schedule.recognized:
+            print(f"[ERROR] Add Prescription rejected: {schedule.reason}")
+            return render_template(
+                "prescription_form.html",
+                selected_user_id=user_id,
+                error=f"Can't schedule this prescription: {schedule.reason}.",
+                form=request.form,
+            ), 400
+
+        cur = db.execute(
             """
             INSERT INTO prescriptions
                 (user_id, name, amount, frequency, refill_date, dosage, time_of_day, status)
@@ -551,6 +600,8 @@ def add_prescription():
             (user_id, name, amount, frequency, refill_date, dosage, time_of_day, status),
         )
         db.commit()
+        dose_events.regenerate(db, cur.lastrowid)
+        dose_scheduler.notify()
 
         if user_id:
             return redirect(url_for("get_prescriptions", user_id=user_id))
@@ -572,6 +623,8 @@ def delete_prescription(prescription_id):
     try:
         db.execute("DELETE FROM prescriptions WHERE prescription_id = ?;", (prescription_id,))
         db.commit()
+        dose_events.delete_for(db, prescription_id)
+        dose_scheduler.notify()
     except Exception as e:
         print(f"[ERROR] delete_prescription failed: {e}")
 
@@ -601,10 +654,44 @@ def dispense():
     try:
         motor_id = int(payload.get("motor_id", 1))
     except (TypeError, ValueError):
-        motor_id = 1
+        return {"success": False, "error": f"Invalid motor_id: {payload.get('motor_id')!r}"}, 400
+
+    # Optional motion profile name (see functions/motion_profiles.py)
+    profile = payload.get("profile")
+    if profile is not None and (not isinstance(profile, str) or profile not in PROFILES):
+        return {"success": False, "error": f"Unknown motion profile: {profile}"}, 400
+
+    # Optional drive mode: "half" (default), "full" or "wave"
+    drive_mode = payload.get("drive_mode")
+    if drive_mode is not None and (not isinstance(drive_mode, str) or drive_mode not in DRIVE_MODES):
+        return {"success": False, "error": f"Unknown drive mode: {drive_mode}"}, 400
+
+    # Optional burst mode: step timing from the I2C clock, not Python
+    burst = bool(payload.get("burst", False))
+
+    # Default: queue the move and answer 202 with a job id to poll at
+    # /jobs/<job_id>; "wait": true keeps the old blocking behaviour
+    wait = bool(payload.get("wait", False))
 
     try:
-        result = core.dispense_slot(user_id=user_id, motor_id=motor_id)
+        result = core.dispense_slot(
+            user_id=user_id,
+            motor_id=motor_id,
+            profile=profile,
+            drive_mode=drive_mode,
+            burst=burst,
+            wait=wait,
+        )
+
+        if result.get("success") and result.get("queued"):
+            print(f"DEBUG: Dispense queued as job {result['job_id']} (motor_id={motor_id})")
+            return {
+                "success": True,
+                "message": "Dispense queued.",
+                "job_id": result["job_id"],
+                "status_url": url_for("job_status", job_id=result["job_id"]),
+                "expected_duration": result.get("expected_duration"),
+            }, 202
 
         if result.get("success"):
             print(
@@ -613,10 +700,16 @@ def dispense():
             return {
                 "success": True,
                 "message": "Dispense completed successfully.",
+                "job_id": result.get("job_id"),
+                "expected_duration": result.get("expected_duration"),
             }, 200
         else:
             error_msg = result.get("error") or "Dispense failed at hardware level."
             print(f"ERROR: Dispense failed -> {error_msg}")
+            if result.get("busy"):
+                return {"success": False, "error": error_msg, "busy": True}, 503, {"Retry-After": "5"}
+            if result.get("unknown_motor"):
+                return {"success": False, "error": error_msg}, 400
             return {
                 "success": False,
                 "error": error_msg,
@@ -629,10 +722,79 @@ def dispense():
             "error": f"Exception occurred: {e}",
         }, 500
 
+@app.route("/dispense_batch", methods=["POST"])
+def dispense_batch():
+    """
+    Dispense from several carousels at once.
+
+    Body: {"items": [{"motor_id": 1, "count": 2}, {"motor_id": 4, "count": 1}],
+           "profile": ..., "drive_mode": ..., "burst": false}
+    """
+    if "user" not in session:
+        return {"success": False, "error": "Unauthorized"}, 401
+
+    user_id = session.get("user_id")
+    payload = request.get_json(silent=True) or {}
+
+    try:
+        items = [
+            (int(item["motor_id"]), int(item.get("count", 1)))
+            for item in payload.get("items", [])
+        ]
+    except (TypeError, ValueError, KeyError):
+        return {"success": False, "error": "items must be a list of {motor_id, count}"}, 400
+    if not items:
+        return {"success": False, "error": "No items to dispense"}, 400
+
+    profile = payload.get("profile")
+    if profile is not None and (not isinstance(profile, str) or profile not in PROFILES):
+        return {"success": False, "error": f"Unknown motion profile: {profile}"}, 400
+
+    drive_mode = payload.get("drive_mode")
+    if drive_mode is not None and (not isinstance(drive_mode, str) or drive_mode not in DRIVE_MODES):
+        return {"success": False, "error": f"Unknown drive mode: {drive_mode}"}, 400
+
+    burst = bool(payload.get("burst", False))
+    wait = bool(payload.get("wait", False))
+
+    try:
+        result = core.dispense_batch(
+            user_id=user_id,
+            items=items,
+            profile=profile,
+            drive_mode=drive_mode,
+            burst=burst,
+            wait=wait,
+        )
+    except Exception as e:
+        print("ERROR: /dispense_batch route crashed ->", e)
+        return {"success": False, "error": f"Exception occurred: {e}"}, 500
+
+    if result.get("success"):
+        status = 202 if result.get("queued") else 200
+    elif result.get("busy"):
+        return {"success": False, "error": result["error"], "busy": True}, 503, {"Retry-After": "5"}
+    elif result.get("plan") is None:
+        status = 400   # rejected by the planner (unknown motor, bad or over-revolution count)
+    else:
+        status = 500
+
+    response = {
+        "success": result["success"],
+        "error": result["error"],
+        "plan": result["plan"],
+        "timings": result["timings"],
+    }
+    if result.get("job_id"):
+        response["job_id"] = result["job_id"]
+        response["status_url"] = url_for("job_status", job_id=result["job_id"])
+    return response, status
+
+
 @app.route("/home_motors", methods=["POST"])
 def home_motors():
     """
-    Home all motors (7 x 320 steps in reverse) and reset call counters.
+    Home all detected motors in parallel and reset call counters.
 
     This will eventually be triggered by a 'Reset / Home All' button on
     the dashboard or Demo Day page.
@@ -640,8 +802,38 @@ def home_motors():
     if "user" not in session:
         return {"success": False, "error": "Unauthorized"}, 401
 
+    payload = request.get_json(silent=True) or {}
+    profile = payload.get("profile")
+    if profile is not None and (not isinstance(profile, str) or profile not in PROFILES):
+        return {"success": False, "error": f"Unknown motion profile: {profile}"}, 400
+
+    drive_mode = payload.get("drive_mode")
+    if drive_mode is not None and (not isinstance(drive_mode, str) or drive_mode not in DRIVE_MODES):
+        return {"success": False, "error": f"Unknown drive mode: {drive_mode}"}, 400
+
+    # "full": true ignores the position journal and rotates 7 slots
+    force_full = bool(payload.get("full", False))
+    parallel = bool(payload.get("parallel", True))
+    wait = bool(payload.get("wait", False))
+
     try:
-        results = core.home_all_motors(direction=-1)
+        results = core.home_all_motors(
+            direction=-1,
+            profile=profile,
+            force_full=force_full,
+            parallel=parallel,
+            drive_mode=drive_mode,
+            wait=wait,
+        )
+
+        # Queued: answer 202 at once, progress is at /jobs/<job_id>
+        if hasattr(results, "job_id"):
+            return {
+                "success": True,
+                "message": "Homing queued.",
+                "job_id": results.job_id,
+                "status_url": url_for("job_status", job_id=results.job_id),
+            }, 202
 
         # results is expected to be a dict like {1: True, 2: True, ...}
         print(f"DEBUG: Home all motors results: {results}")
@@ -659,6 +851,9 @@ def home_motors():
                 "results": results,
             }, 500
 
+    except HardwareBusy as e:
+        return {"success": False, "error": str(e), "busy": True}, 503, {"Retry-After": "5"}
+
     except Exception as e:
         print("ERROR: /home_motors route crashed ->", e)
         return {
@@ -666,6 +861,63 @@ def home_motors():
             "error": f"Exception occurred: {e}",
         }, 500
 
+@app.route("/jobs/<job_id>", methods=["GET"])
+def job_status(job_id):
+    """State, percent of steps done and timing of a dispense / homing job."""
+    if "user" not in session:
+        return {"success": False, "error": "Unauthorized"}, 401
+
+    status = core.job_status(job_id)
+    if status is None:
+        return {"success": False, "error": f"Unknown job: {job_id}"}, 404
+    return {"success": True, "job": status}, 200
+
+@app.route("/jobs", methods=["GET"])
+def job_list():
+    """Queued, running and recently finished motion jobs."""
+    if "user" not in session:
+        return {"success": False, "error": "Unauthorized"}, 401
+
+    return {"success": True, "jobs": core.jobs()}, 200
+
+@app.route("/motion_profiles", methods=["GET"])
+def motion_profiles():
+    """List motion profiles and their expected dispense / homing durations."""
+    if "user" not in session:
+        return {"success": False, "error": "Unauthorized"}, 401
+
+    return {
+        "success": True,
+        "profiles": core.motion_profiles(),
+        "drive_modes": core.drive_modes(),
+    }, 200
+
+@app.route("/motor_stats", methods=["GET"])
+def motor_stats():
+    """Step timing statistics of the most recent motor moves."""
+    if "user" not in session:
+        return {"success": False, "error": "Unauthorized"}, 401
+
+    return {
+        "success": True,
+        "stats": core.motor_timing_stats(),
+        "positions": core.motor_positions(),
+        "arbiter": core.hardware_stats(),
+    }, 200
+
+@app.route("/db_stats", methods=["GET"])
+def db_stats():
+    """SQLite connection pool and dose cache statistics."""
+    if "user" not in session:
+        return {"success": False, "error": "Unauthorized"}, 401
+
+    return {
+        "success": True,
+        "pool": db_pool.stats(),
+        "open_doses": dose_events.open_doses.stats(),
+        "scheduler": dose_scheduler.status(),
+    }, 200
+
 @app.route("/demo_alarms", methods=["POST"])
 def demo_alarms():
     """
@@ -679,7 +931,8 @@ def demo_alarms():
         core.trigger_alarms(duration=30.0)
         return {
             "success": True,
-            "message": "Demo alarms triggered successfully.",
+            "message": "Demo alarms started (30 s).",
+            "alarm": core.alarm_status(),
         }, 200
 
     except Exception as e:
@@ -689,6 +942,18 @@ def demo_alarms():
             "error": f"Exception occurred: {e}",
         }, 500
 
+@app.route("/clear_alarms", methods=["POST"])
+def clear_alarms():
+    """Silence a running alarm (piezo + NeoPixel)."""
+    if "user" not in session:
+        return {"success": False, "error": "Unauthorized"}, 401
+
+    was_active = core.clear_alarms()
+    return {
+        "success": True,
+        "message": "Alarm cleared." if was_active else "No alarm was running.",
+    }, 200
+
 # --- device / screen communication endpoints ---
 
 @app.route("/ping", methods=["GET"])
@@ -705,32 +970,18 @@ def get_time():
 
 @app.route("/check_alert", methods=["GET"])
 def check_alert():
-    """Return the nearest due dose within ±15 min, including its prescription_id."""
-    now = datetime.now().strftime("%H:%M")
-    now_dt = datetime.strptime(now, "%H:%M")
-    db = get_db()
-
-    meds = db.execute(
-        "SELECT prescription_id, user_id, name, time_of_day, status FROM prescriptions WHERE status='Active'"
-    ).fetchall()
-
-    closest = None
-    closest_diff = 99999.0
-    for med in meds:
-        try:
-            med_time_dt = datetime.strptime(med["time_of_day"], "%H:%M")
-        except Exception:
-            continue
-        diff = abs((now_dt - med_time_dt).total_seconds() / 60.0)
-        if diff <= 15 and diff < closest_diff:
-            closest = med
-            closest_diff = diff
+    """Return the nearest open dose within ±15 min, including its prescription_id."""
+    # Hot path (kiosk polls every 5 s): cached sorted array, DB only after changes
+    closest = dose_events.open_doses.nearest(get_db(), datetime.now())
 
     if closest:
         return {
             "alert": True,
             "user_id": closest["user_id"],
             "prescription_id": closest["prescription_id"],
+            "event_id": closest["event_id"],
+            "due_at": closest["due_at"],
+            "state": closest["state"],
             "name": closest["name"],
             "message": "Scan Finger to Dispense",
             "color": "red"
@@ -743,19 +994,28 @@ def check_alert():
 def sync_actions():
     """
     Body: {"actions":[{"prescription_id": <int>, "action":"dispense", "success": true}]}
+    ("event_id" may be sent instead of / with prescription_id)
     """
     data = request.get_json(force=True)
     actions = data.get("actions", [])
     db = get_db()
-    now = datetime.now().strftime("%H:%M")
+    now = datetime.now()
+    dispensed = 0
     for action in actions:
         if action.get("action") == "dispense" and action.get("success"):
+            event_id = action.get("event_id")
+            if event_id is None:
+                event = dose_events.nearest_open(db, now, action.get("prescription_id"))
+                event_id = event["event_id"] if event else None
+            if event_id is not None:
+                dispensed += dose_events.mark(db, [event_id], dose_events.DISPENSED, now)
             db.execute(
-                "UPDATE prescriptions SET status='Dispensed', last_dispensed=? WHERE prescription_id=?",
-                (now, action["prescription_id"])
+                "UPDATE prescriptions SET last_dispensed=? WHERE prescription_id=?",
+                (dose_events.fmt(now), action.get("prescription_id"))
             )
     db.commit()
-    return {"success": True}, 200
+    dose_scheduler.notify()
+    return {"success": True, "dispensed": dispensed}, 200
 
 
 if __name__ == "__main__":
@@ -763,8 +1023,7 @@ if __name__ == "__main__":
 
     # Prevent multiple threads from starting
     if not any(t.name == "MedicationScheduler" for t in threading.enumerate()):
-        alert_thread = threading.Thread(target=check_medication_schedule, daemon=True, name="MedicationScheduler")
-        alert_thread.start()
+        dose_scheduler.start()
         print("🔄 Background thread for medication alerts started.")
 
     app.run(host="0.0.0.0", port=5000, debug=False)  # Disable auto-reload to prevent duplicate threads
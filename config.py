@@ -1,2 +1,59 @@
 # config.py
+import os
+
 FINGERPRINT_REQUIRED = False   # Demo day = False
+
+# Motor I2C backend: "hardware" (smbus2) or "sim" (in-memory MCP23017s,
+# see functions/sim/mcp23017_sim.py). Override with PILLSYNC_MOTOR_BACKEND.
+MOTOR_BACKEND = os.environ.get("PILLSYNC_MOTOR_BACKEND", "hardware")
+SIM_EXPANDER_ADDRS = (0x20, 0x21)
+SIM_I2C_LATENCY = 0.0002       # seconds per simulated transaction
+
+# I2C clock (Hz) as set in /boot/firmware/config.txt; burst-mode step
+# timing is derived from it, so keep the two in sync.
+I2C_BUS_HZ = 100_000
+
+# Motor driving: "inprocess" (motion thread inside the Flask process) or
+# "process" (separate real-time driver, see functions/motor_driver_process.py;
+# falls back to in-process if it can't be reached). PILLSYNC_MOTOR_DRIVER.
+MOTOR_DRIVER = os.environ.get("PILLSYNC_MOTOR_DRIVER", "inprocess")
+MOTOR_DRIVER_SOCKET = os.environ.get("PILLSYNC_MOTOR_SOCKET", "/run/pillsync/motor.sock")
+# Group allowed to connect (socket 0o660, /run/pillsync 0o770); PillSync's
+# user must be a member, also when the driver is started with sudo
+MOTOR_DRIVER_SOCKET_GROUP = os.environ.get("PILLSYNC_MOTOR_GROUP", "gpio")
+MOTOR_DRIVER_SPAWN = True      # start the driver if nothing is listening
+MOTOR_DRIVER_RT_PRIORITY = 50  # SCHED_FIFO priority (needs root / CAP_SYS_NICE)
+MOTOR_DRIVER_CPU = None        # pin the driver to one core, e.g. 3
+
+# Piezo PWM: "gpio" (RPi.GPIO software PWM) or "pigpio" (hardware PWM via
+# pigpiod, exact tone timing). Override with PILLSYNC_PIEZO_BACKEND.
+PIEZO_BACKEND = os.environ.get("PILLSYNC_PIEZO_BACKEND", "gpio")
+
+# NeoPixel helper daemon (functions/neopixel_daemon.py, runs as root).
+# Without it, flashes fall back to `sudo /usr/local/bin/neopixel_driver.py`.
+NEOPIXEL_SOCKET = os.environ.get("PILLSYNC_NEOPIXEL_SOCKET", "/run/pillsync/neopixel.sock")
+# Group allowed to connect to it (socket is 0o660); PillSync's user must be a member
+NEOPIXEL_SOCKET_GROUP = os.environ.get("PILLSYNC_NEOPIXEL_GROUP", "gpio")
+NEOPIXEL_PIN = "D13"           # board pin name (GPIO13)
+NEOPIXEL_COUNT = 8
+NEOPIXEL_BRIGHTNESS = 0.3
+NEOPIXEL_ALERT_COLOR = (255, 80, 0)   # orange
+
+# Hardware arbitration: seconds a request waits for its motors, and how
+# many motion jobs may queue, before it is answered "busy". A motor stays
+# claimed until its move finishes, so anything above 0 parks a Flask
+# thread for (part of) someone else's move: answer 503 at once instead.
+MOTOR_CLAIM_TIMEOUT = 0.0
+MAX_PENDING_MOTION_JOBS = 8
+
+# Motor nibbles wired per MCP23017: 3 (GPA0–3, GPA4–7, GPB0–3) or 4 (+GPB4–7)
+MOTORS_PER_EXPANDER = 3
+# Ignore data/expanders.json and probe 0x20–0x27 again (e.g. after adding a board)
+RESCAN_EXPANDERS = os.environ.get("PILLSYNC_RESCAN_EXPANDERS") == "1"
+
+# SQLite (functions/db.py): per-connection page cache, memory-mapped I/O,
+# prepared statements kept per connection, and idle connections pooled
+DB_CACHE_SIZE_KIB = 8192            # 8 MiB
+DB_MMAP_SIZE = 64 * 1024 * 1024     # 64 MiB
+DB_CACHED_STATEMENTS = 256
+DB_POOL_MAX_IDLE = 4
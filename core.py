@@ -11,8 +11,11 @@ app.py (Flask) should import and call these high-level functions:
 
     core.dispense_slot(user_id=..., motor_id=...)
     core.home_all_motors()
-    core.trigger_alarms(duration=30)
-    core.clear_alarms()
+    core.dispense_slot(..., wait=False)   # returns at once with a job id
+    core.job_status(job_id)               # state / percent / timing
+    core.dispense_batch(user_id=..., items=[(1, 2), (4, 1)])
+    core.trigger_alarms(duration=30)      # returns at once
+    core.clear_alarms()                   # stops within one chirp
 
 Later:
     core.verify_fingerprint(user_id=...)
@@ -20,23 +23,90 @@ Later:
 
 from typing import Optional, Dict
 
-from functions.motor_array import MotorArray, MotorLimitReached
-from functions.motor_homing import home_all_motors as _home_all_motors
-from functions.piezo_alarm import alarm as piezo_alarm
-from functions.neopixel_alarm import alarm_flash as neopixel_alarm
-from config import FINGERPRINT_REQUIRED
+from functions.motor_array import (
+    MotorLimitReached,
+    WHOLESTEPS_PER_CALL,
+    HALFSTEPS_PER_WHOLESTEP,
+)
+from functions.motor_driver_process import build_motor_array, connect_motor_driver
+from functions.motor_homing import home_all_motors as _home_all_motors, HOME_WHOLESTEPS
+from functions.motion_profiles import PROFILES
+from functions.dispense_planner import plan_batch, run_batch
+from functions.drive_modes import DRIVE_MODES
+from functions.motion_controller import MotionController
+from functions.hardware_arbiter import HardwareArbiter, HardwareBusy
+from functions import piezo_alarm, neopixel_alarm
+from functions.alarm_engine import AlarmEngine
+from config import (
+    FINGERPRINT_REQUIRED,
+    MOTOR_DRIVER,
+    MOTOR_DRIVER_SOCKET,
+    MOTOR_DRIVER_SPAWN,
+    MOTOR_CLAIM_TIMEOUT,
+    MAX_PENDING_MOTION_JOBS,
+)
 from functions.fingerprint import fp
 
 class CoreController:
     def __init__(self):
-        # Single MotorArray instance for the entire app
+        # Single MotorArray instance for the entire app – either a client
+        # of the separate motor-driver process or an in-process MotorArray
+        self.motor_array = None
+        if MOTOR_DRIVER == "process":
+            self.motor_array = connect_motor_driver(MOTOR_DRIVER_SOCKET, spawn=MOTOR_DRIVER_SPAWN)
+            if self.motor_array is None:
+                print("[Core] Motor driver process unavailable; driving motors in-process")
+
         # Wrap in try/except so UI can still run even if I2C is not available
-        try:
-            self.motor_array = MotorArray()
-        except OSError as e:
-            print(f"WARN: MotorArray initialization failed: {e}")
-            self.motor_array = None
+        if self.motor_array is None:
+            try:
+                self.motor_array = build_motor_array()
+            except OSError as e:
+                print(f"WARN: MotorArray initialization failed: {e}")
+
+        # All moves run on the motion-controller thread, which owns the bus.
+        # The arbiter admits jobs: per-motor claims, bus lock, "busy" on timeout
+        self.motion = None
+        self.arbiter = HardwareArbiter(
+            claim_timeout=MOTOR_CLAIM_TIMEOUT,
+            max_pending=MAX_PENDING_MOTION_JOBS,
+            pending=lambda: self.motion.pending() if self.motion is not None else 0,
+        )
+        if self.motor_array is not None:
+            self.motion = MotionController(self.motor_array, bus_lock=self.arbiter.bus)
+            self.motion.start()
+
+        # Piezo + NeoPixel on one timeline, off the caller's thread
+        self.alarms = AlarmEngine(
+            chirp=piezo_alarm.chirp_sweep,
+            light_on=neopixel_alarm.flash_on,
+            light_off=neopixel_alarm.flash_off,
+            silence=piezo_alarm.silence,
+            light_pattern=neopixel_alarm.play_alarm_pattern,
+        )
+        self.alarms.start()
 
+    def _submit_claimed(self, kind, motor_ids, fn, *args, **kwargs):
+        """
+        Claim `motor_ids`, queue the job, release the claim when it ends.
+        Raises HardwareBusy if the motors are not free within
+        MOTOR_CLAIM_TIMEOUT (0 by default), so a request never waits out
+        another job's move.
+        """
+        claim = self.arbiter.claim(motor_ids, label=kind)
+        try:
+            future = self.motion.submit(kind, fn, *args, **kwargs)
+        except BaseException:
+            claim.release()
+            raise
+        future.add_done_callback(claim.release)
+        return future
+
+    def _clear_alarms_if_dispensed(self, future):
+        # Future done-callback on the motion thread: the pills are out,
+        # stop the reminder without waiting for the outputs to go quiet
+        if not future.cancelled() and future.exception() is None:
+            self.alarms.clear(wait=0)
 
     # ------------------------------------------------------------------
     # DISPENSING
@@ -58,6 +128,8 @@ class CoreController:
             user_id: Optional[int],
             motor_id: int,
             direction: int = 1,
+            profile: Optional[str] = None,
+            drive_mode: Optional[str] = None,
         ) -> Dict[str, object]:
         """
         SECURITY WRAPPER for dispensing.
@@ -97,6 +169,8 @@ class CoreController:
             user_id=user_id,
             motor_id=motor_id,
             direction=direction,
+            profile=profile,
+            drive_mode=drive_mode,
         )
 
 
@@ -109,6 +183,10 @@ class CoreController:
             user_id: Optional[int],
             motor_id: int,
             direction: int = 1,
+            profile: Optional[str] = None,
+            wait: bool = True,
+            drive_mode: Optional[str] = None,
+            burst: bool = False,
         ) -> Dict[str, object]:
             """
             Dispense a single dose from the given motor/slot.
@@ -116,6 +194,13 @@ class CoreController:
             :param user_id: ID of the user this dispense is for (can be None for demo mode)
             :param motor_id: motor number 1–6
             :param direction: +1 or -1 (normally +1 for forward dispense)
+            :param profile: optional motion profile name (see motion_profiles.py)
+            :param drive_mode: "half" (default), "full" or "wave" (see drive_modes.py)
+            :param burst: stream the move over I2C (bus-clock timed) instead
+                          of timing each step in Python
+            :param wait: block until the move finishes; if False the job is
+                         queued, result["job_id"] can be polled with
+                         job_status() and result["future"] tracks it
             :return: dict with status info (for logging / UI feedback)
             """
 
@@ -124,20 +209,57 @@ class CoreController:
                 "error": None,
                 "motor_id": motor_id,
                 "user_id": user_id,
+                "expected_duration": None,
             }
 
             if self.motor_array is None:
                 result["error"] = "MotorArray not initialized (I2C unavailable)."
                 return result
 
+            # Reject bad motors now rather than in a job nobody waits on
+            if motor_id not in self.motor_array.motor_map:
+                result["error"] = f"Motor {motor_id} not available on detected hardware"
+                result["unknown_motor"] = True
+                return result
+
             try:
-                self.motor_array.step_motor(
-                    motor_id=motor_id,
-                    direction=direction,
-                    enforce_limits=False,   # ⭐ PATCH: disable call-limit enforcement
+                result["expected_duration"] = self.motor_array.estimate_duration(
+                    profile=profile,
+                    drive_mode=drive_mode,
+                )
+                future = self._submit_claimed(
+                    "dispense",
+                    [motor_id],
+                    lambda ma: ma.step_motor(
+                        motor_id=motor_id,
+                        direction=direction,
+                        enforce_limits=False,   # ⭐ PATCH: disable call-limit enforcement
+                        profile=profile,
+                        drive_mode=drive_mode,
+                        burst=burst,
+                    ),
+                    job_info={
+                        "motor_id": motor_id,
+                        "user_id": user_id,
+                        "expected_duration": result["expected_duration"],
+                    },
                 )
+                result["job_id"] = future.job_id
+                future.add_done_callback(self._clear_alarms_if_dispensed)
+
+                if not wait:
+                    result["success"] = True
+                    result["queued"] = True
+                    result["future"] = future
+                    return result
+
+                future.result()
                 result["success"] = True
 
+            except HardwareBusy as e:
+                result["error"] = str(e)
+                result["busy"] = True
+
             except MotorLimitReached as e:
                 result["error"] = str(e)
 
@@ -147,22 +269,208 @@ class CoreController:
             return result
 
 
+    def dispense_batch(
+            self,
+            user_id: Optional[int],
+            items,
+            direction: int = 1,
+            profile: Optional[str] = None,
+            wait: bool = True,
+            drive_mode: Optional[str] = None,
+            burst: bool = False,
+        ) -> Dict[str, object]:
+        """
+        Dispense from several carousels in one go.
+
+        :param items: list of (motor_id, count) pairs
+        :return: dict with the plan (see dispense_planner.py) and, once the
+                 job has run, per-motor timings in result["timings"]
+
+        Every motor moves at the same time (one rotation time for the
+        whole dose instead of one per carousel); only moves that cannot
+        share a timebase (burst moves on different ports) run one after
+        another. With wait=False the job is queued, result["job_id"] can
+        be polled with job_status() and result["future"] resolves to the
+        timings.
+        """
+        result = {
+            "success": False,
+            "error": None,
+            "user_id": user_id,
+            "plan": None,
+            "timings": None,
+        }
+
+        if self.motor_array is None:
+            result["error"] = "MotorArray not initialized (I2C unavailable)."
+            return result
+
+        try:
+            plan = plan_batch(
+                self.motor_array.motor_map,
+                items,
+                profile=profile,
+                drive_mode=drive_mode,
+                burst=burst,
+            )
+            result["plan"] = plan
+
+            future = self._submit_claimed(
+                "dispense",
+                [m["motor_id"] for p in plan["phases"] for m in p["motors"]],
+                run_batch,
+                plan,
+                direction=direction,
+                profile=profile,
+                drive_mode=drive_mode,
+                burst=burst,
+                job_info={
+                    "user_id": user_id,
+                    "motor_ids": [m["motor_id"] for p in plan["phases"] for m in p["motors"]],
+                    "expected_duration": plan["expected_duration"],
+                },
+            )
+            result["job_id"] = future.job_id
+            future.add_done_callback(self._clear_alarms_if_dispensed)
+
+            if not wait:
+                result["success"] = True
+                result["queued"] = True
+                result["future"] = future
+                return result
+
+            result["timings"] = future.result()
+            result["success"] = True
+
+        except HardwareBusy as e:
+            result["error"] = str(e)
+            result["busy"] = True
+
+        except ValueError as e:
+            result["error"] = str(e)
+
+        except Exception as e:  # catch-all for hardware errors
+            result["error"] = f"Unexpected motor error: {e}"
+
+        return result
+
     # ------------------------------------------------------------------
     # HOMING
     # ------------------------------------------------------------------
-    def home_all_motors(self, direction: int = -1) -> Dict[int, bool]:
+    def home_all_motors(
+            self,
+            direction: int = -1,
+            profile: Optional[str] = None,
+            wait: bool = True,
+            force_full: bool = False,
+            parallel: bool = True,
+            drive_mode: Optional[str] = None,
+        ):
         """
-        Home all motors (one at a time), resetting their internal call counts.
+        Home all detected motors, resetting their internal call counts.
+
+        By default every motor turns at the same time (parallel=True), so
+        homing costs one rotation regardless of carousel count. Motors
+        whose position is known from the position journal only turn the
+        shortest way back to slot 0; force_full=True always does the
+        full 7-slot rotation.
+
+        Runs as a "homing" job on the motion thread, ahead of any queued
+        dispenses. With wait=False the Future is returned immediately
+        (future.job_id for job_status()); its result is the usual
+        {motor_id: bool} dict. Raises HardwareBusy if any motor is
+        still claimed by another job after MOTOR_CLAIM_TIMEOUT (0: at once).
         """
         if self.motor_array is None:
             print("WARN: home_all_motors called but MotorArray is not initialized.")
             # Return False for all motors to indicate failure
             return {mid: False for mid in range(1, 7)}
 
-        return _home_all_motors(
-            motor_array=self.motor_array,
+        future = self._submit_claimed(
+            "homing",
+            list(self.motor_array.motor_map),
+            _home_all_motors,
             direction=direction,
+            profile=profile,
+            force_full=force_full,
+            parallel=parallel,
+            drive_mode=drive_mode,
         )
+        if not wait:
+            return future
+        return future.result()
+
+    # ------------------------------------------------------------------
+    # MOTION JOBS
+    # ------------------------------------------------------------------
+    def job_status(self, job_id: str) -> Optional[dict]:
+        """State, percent of steps done and timing of a motion job (None if unknown)."""
+        if self.motion is None:
+            return None
+        return self.motion.job_status(job_id)
+
+    def jobs(self):
+        """Queued, running and recently finished motion jobs."""
+        if self.motion is None:
+            return []
+        return self.motion.job_list()
+
+    # ------------------------------------------------------------------
+    # MOTOR DIAGNOSTICS
+    # ------------------------------------------------------------------
+    def motor_positions(self) -> Dict[int, dict]:
+        """Journaled carousel position / slot of each motor."""
+        if self.motor_array is None:
+            return {}
+        return self.motor_array.position_info()
+
+    def motor_timing_stats(self) -> Dict[str, object]:
+        """
+        Step-interval jitter / overrun stats of the last moves, plus
+        I2C transaction counts, for spotting timing degradation under load.
+        """
+        if self.motor_array is None:
+            return {"last_move": None, "motors": {}, "bus": None}
+
+        # Same shape whether the motors run in-process or in the driver process
+        stats = self.motor_array.timing_stats()
+        stats["bus"] = self.motor_array.bus_stats()
+        if hasattr(self.motor_array.bus, "stats"):
+            stats["sim_bus"] = self.motor_array.bus.stats()
+        stats["arbiter"] = self.arbiter.stats()
+        return stats
+
+    def hardware_stats(self) -> Dict[str, object]:
+        """Queue depth, lock holders and wait times of the hardware arbiter."""
+        return self.arbiter.stats()
+
+    # ------------------------------------------------------------------
+    # MOTION PROFILES
+    # ------------------------------------------------------------------
+    def motion_profiles(self) -> Dict[str, dict]:
+        """
+        Available motion profiles with their expected move durations,
+        so the UI can show how long a dispense / homing will take.
+        Durations are per drive mode (full-step moves need half the writes).
+        """
+        profiles = {}
+        for name, profile in PROFILES.items():
+            info = profile.to_dict()
+            info["dispense_duration"] = {}
+            info["home_duration"] = {}
+            for mode_name, mode in DRIVE_MODES.items():
+                per_write = mode.halfsteps_per_step
+                info["dispense_duration"][mode_name] = profile.duration(
+                    WHOLESTEPS_PER_CALL * HALFSTEPS_PER_WHOLESTEP // per_write
+                )
+                info["home_duration"][mode_name] = profile.duration(
+                    HOME_WHOLESTEPS * HALFSTEPS_PER_WHOLESTEP // per_write
+                )
+            profiles[name] = info
+        return profiles
+
+    def drive_modes(self):
+        return list(DRIVE_MODES)
 
 
 
@@ -171,28 +479,41 @@ class CoreController:
     # ------------------------------------------------------------------
     def trigger_alarms(self, duration: float = 30.0):
         """
-        Trigger both piezo and neopixel alarms.
+        Trigger both piezo and neopixel alarms, in sync.
 
-        NOTE: This is a blocking call. If you don't want to block Flask,
-        call this from a background thread in app.py.
+        Returns immediately; the AlarmEngine thread plays the pattern.
+        Triggering while an alarm runs extends it.
         """
-        piezo_alarm(duration=duration)
-        neopixel_alarm(duration=duration)
+        self.alarms.trigger(duration=duration)
+
+    def trigger_dose_alarm(self, doses, duration: float = 30.0) -> Dict[str, object]:
+        """
+        One alarm for every dose due in a scheduler tick.
+
+        `doses` is a list of {"prescription_id", "user_id", "name"} dicts.
+        If an alarm is already running the doses join that episode and
+        extend it, instead of queueing another alarm.
+        """
+        self.alarms.trigger(duration=duration, doses=doses)
+        return self.alarms.status()
 
     def trigger_piezo_only(self, duration: float = 30.0):
         """Convenience helper for just the buzzer."""
-        piezo_alarm(duration=duration)
+        self.alarms.trigger(duration=duration, lights=False)
 
     def trigger_neopixel_only(self, duration: float = 30.0):
         """Convenience helper for just the Neopixel."""
-        neopixel_alarm(duration=duration)
+        self.alarms.trigger(duration=duration, piezo=False)
 
-    def clear_alarms(self):
+    def clear_alarms(self) -> bool:
         """
-        Placeholder in case we later add non-blocking alarms
-        that can be cancelled mid-way.
+        Stop a running alarm (within one chirp). Called automatically
+        after a successful dispense. Returns True if one was running.
         """
-        pass
+        return self.alarms.clear()
+
+    def alarm_status(self) -> Dict[str, object]:
+        return self.alarms.status()
 
     # ------------------------------------------------------------------
     # FINGERPRINT (FUTURE HOOKS)
@@ -212,7 +533,16 @@ class CoreController:
         Call this on app exit if needed.
         """
         try:
-            self.motor_array.close()
+            self.alarms.shutdown()
+            piezo_alarm.cleanup()
+        except Exception:
+            pass
+
+        try:
+            if self.motion is not None:
+                self.motion.stop(timeout=5.0)   # closes the MotorArray
+            elif self.motor_array is not None:
+                self.motor_array.close()
         except Exception:
             pass
 
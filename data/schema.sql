@@ -19,3 +19,17 @@ CREATE TABLE prescriptions (
     status TEXT DEFAULT 'Active',
     FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE
 );
+
+-- Create Dose Events table (one row per dose per day, see functions/dose_events.py)
+CREATE TABLE dose_events (
+    event_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    prescription_id INTEGER NOT NULL,
+    user_id INTEGER,
+    due_at TEXT NOT NULL,                -- 'YYYY-MM-DD HH:MM:SS', local time
+    state TEXT NOT NULL DEFAULT 'pending', -- pending / alerted / dispensed / missed
+    alerted_at TEXT,
+    dispensed_at TEXT,
+    UNIQUE (prescription_id, due_at),
+    FOREIGN KEY (prescription_id) REFERENCES prescriptions(prescription_id) ON DELETE CASCADE
+);
+CREATE INDEX idx_dose_events_due_state ON dose_events (due_at, state);
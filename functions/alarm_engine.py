@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""
+Alarm engine for PillSyncOS.
+
+Runs the piezo and the NeoPixels together on one timeline from a
+single background thread, so callers (the medication scheduler, Flask
+requests) never block on an alarm:
+
+    chirp:  light on + piezo sweep (CHIRP_ON), light off, gap (CHIRP_OFF)
+    group:  CHIRPS_PER_GROUP chirps, then GROUP_PAUSE
+
+Chirp start times are taken from a monotonic schedule rather than
+"sleep after each step", so the pattern does not drift over a 30 s
+alarm. trigger() returns at once (a second trigger extends the running
+alarm); clear() stops it before the next chirp – at most one chirp
+sweep later. A trigger() that lands after clear() but before the
+worker has wound the stopped alarm down starts a fresh episode on the
+same worker run, so a dose that comes due right after a dispense still
+sounds.
+
+One alarm run is an "episode". Dose alarms pass the doses they are for;
+every dose that comes due while an episode runs is merged into it, so
+status() always shows which prescriptions / users the alarm is about.
+
+Outputs are plain callables, so either one can be left out and the
+engine can be driven without hardware. With a `light_pattern` output
+(the NeoPixel daemon) the flash pattern is handed over once per alarm
+and played by the daemon, instead of one on/off command per chirp.
+"""
+
+import threading
+import time
+
+from functions.neopixel_alarm import CHIRPS_PER_GROUP, CHIRP_ON, CHIRP_OFF, GROUP_PAUSE
+
+
+class AlarmEngine(threading.Thread):
+    def __init__(self, chirp=None, light_on=None, light_off=None, silence=None,
+                 light_pattern=None):
+        """
+        :param chirp: chirp(on_time) – blocking piezo sweep
+        :param light_on / light_off: NeoPixel flash on / off (non-blocking)
+        :param silence: force the piezo quiet
+        :param light_pattern: light_pattern(duration) -> bool, plays the whole
+                              flash pattern remotely; False → per-chirp on/off
+        """
+        super().__init__(name="AlarmEngine", daemon=True)
+        self._chirp = chirp
+        self._light_on = light_on
+        self._light_off = light_off
+        self._silence = silence
+        self._light_pattern = light_pattern
+        self._lights_dirty = False
+
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop_alarm = threading.Event()
+        self._idle = threading.Event()
+        self._idle.set()
+        self._shutdown = False
+
+        self.active = False
+        self.use_piezo = True
+        self.use_lights = True
+        self.started_at = None
+        self.ends_at = None          # monotonic
+        self.episodes = 0
+        self.chirps = 0
+        self.doses = []              # doses tagged on the current / last episode
+
+    # -------------------------------------------------------------
+    # Control
+    # -------------------------------------------------------------
+    def trigger(self, duration: float = 30.0, piezo: bool = True, lights: bool = True,
+                doses=None):
+        """
+        Start (or extend) an alarm; returns immediately.
+
+        :param doses: optional list of {"prescription_id", "user_id", "name"}
+                      dicts the alarm is for; merged into a running episode
+        """
+        with self._lock:
+            ends_at = time.monotonic() + duration
+            if self.active and self._stop_alarm.is_set():
+                # clear() was called and the worker is still winding down:
+                # take the stop back and run the new alarm as its own episode
+                self.use_piezo = piezo
+                self.use_lights = lights
+                self.started_at = time.time()
+                self.ends_at = ends_at
+                self.episodes += 1
+                self.doses = []
+                self._merge_doses(doses)
+                self._lights_dirty = True
+                self._stop_alarm.clear()
+                print("[AlarmEngine] Alarm restarted after clear()")
+                return
+
+            if self.active:
+                self.ends_at = max(self.ends_at, ends_at)
+                self.use_piezo = self.use_piezo or piezo
+                self.use_lights = self.use_lights or lights
+                self._lights_dirty = True   # resend the light pattern
+                self._merge_doses(doses)
+                return
+
+            self.active = True
+            self.use_piezo = piezo
+            self.use_lights = lights
+            self.started_at = time.time()
+            self.ends_at = ends_at
+            self.episodes += 1
+            self.doses = []
+            self._merge_doses(doses)
+            self._stop_alarm.clear()
+            self._idle.clear()
+            self._wake.set()
+
+    def _merge_doses(self, doses):
+        known = {d.get("prescription_id") for d in self.doses}
+        for dose in doses or ():
+            if dose.get("prescription_id") not in known:
+                self.doses.append(dict(dose))
+                known.add(dose.get("prescription_id"))
+
+    def clear(self, wait: float = 1.0) -> bool:
+        """
+        Stop the running alarm. Waits up to `wait` seconds for the
+        outputs to go quiet; returns True if an alarm was running.
+        """
+        with self._lock:
+            was_active = self.active
+            self._stop_alarm.set()
+        if was_active and wait:
+            self._idle.wait(wait)
+        return was_active
+
+    def shutdown(self):
+        self._shutdown = True
+        self.clear()
+        self._wake.set()
+
+    def status(self) -> dict:
+        with self._lock:
+            remaining = None
+            if self.active:
+                remaining = max(0.0, self.ends_at - time.monotonic())
+            return {
+                "active": self.active,
+                "piezo": self.use_piezo,
+                "lights": self.use_lights,
+                "started_at": self.started_at,
+                "remaining_s": remaining,
+                "episodes": self.episodes,
+                "chirps": self.chirps,
+                "doses": [dict(d) for d in self.doses],
+                "prescription_ids": [d.get("prescription_id") for d in self.doses],
+                "user_ids": sorted({d.get("user_id") for d in self.doses
+                                    if d.get("user_id") is not None}),
+            }
+
+    # -------------------------------------------------------------
+    # Worker
+    # -------------------------------------------------------------
+    @staticmethod
+    def _output(fn, *args):
+        # One broken output (e.g. no GPIO on a dev box) must not stop the other
+        if fn is None:
+            return
+        try:
+            fn(*args)
+        except Exception as e:
+            print(f"[AlarmEngine] Output {getattr(fn, '__name__', fn)} failed: {e}")
+
+    def _wait_until(self, t):
+        remaining = t - time.monotonic()
+        if remaining > 0:
+            self._stop_alarm.wait(remaining)
+
+    def _start_light_pattern(self) -> bool:
+        if not self.use_lights or self._light_pattern is None:
+            return False
+        self._lights_dirty = False
+        try:
+            return bool(self._light_pattern(self.ends_at - time.monotonic()))
+        except Exception as e:
+            print(f"[AlarmEngine] Light pattern failed: {e}")
+            return False
+
+    def _play(self):
+        next_chirp = time.monotonic()
+        remote_lights = self._start_light_pattern()
+        try:
+            while not self._stop_alarm.is_set() and time.monotonic() < self.ends_at:
+                # Extended alarm: restart the remote pattern on a group boundary
+                if self._lights_dirty:
+                    remote_lights = self._start_light_pattern()
+
+                for _ in range(CHIRPS_PER_GROUP):
+                    if self._stop_alarm.is_set():
+                        break
+
+                    local_lights = self.use_lights and not remote_lights
+                    if local_lights:
+                        self._output(self._light_on)
+                    if self.use_piezo and self._chirp is not None:
+                        self._output(self._chirp, CHIRP_ON)
+                    else:
+                        self._wait_until(next_chirp + CHIRP_ON)
+                    if local_lights:
+                        self._output(self._light_off)
+                    self.chirps += 1
+
+                    next_chirp += CHIRP_ON + CHIRP_OFF
+                    self._wait_until(next_chirp)
+
+                next_chirp += GROUP_PAUSE
+                self._wait_until(next_chirp)
+        finally:
+            self._output(self._light_off)
+            self._output(self._silence)
+
+    def run(self):
+        while True:
+            self._wake.wait()
+            self._wake.clear()
+            if self._shutdown:
+                break
+
+            tags = [d.get("prescription_id") for d in self.doses]
+            print("[AlarmEngine] Alarm started" + (f" for prescriptions {tags}" if tags else ""))
+            while True:
+                self._play()
+                with self._lock:
+                    # A trigger() may have extended the alarm as it ran out
+                    # (or restarted it after a clear(), see trigger())
+                    if (not self._stop_alarm.is_set() and not self._shutdown
+                            and time.monotonic() < self.ends_at):
+                        continue
+                    self.active = False
+                    self.ends_at = None
+                    # Under the lock: a trigger() right after must not see idle set
+                    self._idle.set()
+                    break
+            print("[AlarmEngine] Alarm stopped")
+
+        self._idle.set()
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+SQLite connection pool for PillSyncOS.
+
+Flask request threads and the medication scheduler share one pool
+instead of calling sqlite3.connect() per request / per tick. A thread
+checks a connection out with acquire() and keeps getting the same one
+(nested acquire() calls are counted) until its last release() returns
+it to the idle list. The dev server runs each request on a fresh
+thread, so connections are recycled through that list rather than tied
+to a thread for life.
+
+Every connection is opened once and tuned:
+
+    journal_mode = WAL       readers never wait for the scheduler's writes
+    synchronous  = NORMAL    fsync at checkpoints, not on every commit (safe with WAL)
+    foreign_keys = ON        ON DELETE CASCADE actually cascades
+    cache_size / mmap_size   more of the DB in RAM, fewer SD card reads
+    cached_statements        larger prepared-statement cache per connection
+
+Usage:
+    pool = ConnectionPool("data/pillsync.db")
+    with pool.connection() as db:
+        db.execute(...)
+    pool.stats()
+"""
+
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from config import DB_CACHE_SIZE_KIB, DB_MMAP_SIZE, DB_CACHED_STATEMENTS, DB_POOL_MAX_IDLE
+
+# Wait this long for a write lock held by another connection
+BUSY_TIMEOUT_MS = 5000
+
+
+class ConnectionPool:
+    def __init__(self, path: str, max_idle: int = DB_POOL_MAX_IDLE,
+                 cache_size_kib: int = DB_CACHE_SIZE_KIB, mmap_size: int = DB_MMAP_SIZE,
+                 cached_statements: int = DB_CACHED_STATEMENTS):
+        self.path = path
+        self.max_idle = max_idle
+        self.cache_size_kib = cache_size_kib
+        self.mmap_size = mmap_size
+        self.cached_statements = cached_statements
+
+        self._lock = threading.Lock()
+        self._idle = []
+        self._local = threading.local()
+        self.journal_mode = None
+
+        self.opened = 0
+        self.closed = 0
+        self.acquired = 0
+        self.reused = 0
+        self.in_use = 0
+        self.max_in_use = 0
+
+    # -------------------------------------------------------------
+    # Connections
+    # -------------------------------------------------------------
+    def _open(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.path,
+            timeout=BUSY_TIMEOUT_MS / 1000,
+            cached_statements=self.cached_statements,
+            check_same_thread=False,   # handed between threads, used by one at a time
+        )
+        conn.row_factory = sqlite3.Row
+        mode = conn.execute("PRAGMA journal_mode = WAL").fetchone()[0]
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conn.execute("PRAGMA foreign_keys = ON")
+        conn.execute(f"PRAGMA cache_size = {-int(self.cache_size_kib)}")
+        conn.execute(f"PRAGMA mmap_size = {int(self.mmap_size)}")
+        conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+
+        with self._lock:
+            self.opened += 1
+            if self.journal_mode != mode:
+                self.journal_mode = mode
+                print(f"[DB] {self.path}: journal_mode={mode}")
+        return conn
+
+    def acquire(self) -> sqlite3.Connection:
+        """This thread's connection (checked out from the idle list on first use)."""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            self._local.depth += 1
+            return conn
+
+        with self._lock:
+            conn = self._idle.pop() if self._idle else None
+            self.acquired += 1
+            if conn is not None:
+                self.reused += 1
+            self.in_use += 1
+            self.max_in_use = max(self.max_in_use, self.in_use)
+        if conn is None:
+            conn = self._open()
+
+        self._local.conn = conn
+        self._local.depth = 1
+        return conn
+
+    def release(self):
+        """Undo one acquire(); the last one returns the connection to the pool."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            return
+        self._local.depth -= 1
+        if self._local.depth > 0:
+            return
+        self._local.conn = None
+
+        if conn.in_transaction:
+            conn.rollback()   # never hand out a connection mid-transaction
+        with self._lock:
+            self.in_use -= 1
+            if len(self._idle) < self.max_idle:
+                self._idle.append(conn)
+                return
+            self.closed += 1
+        conn.close()
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release()
+
+    def close_all(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+            self.closed += len(idle)
+        for conn in idle:
+            conn.close()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "path": self.path,
+                "journal_mode": self.journal_mode,
+                "opened": self.opened,
+                "closed": self.closed,
+                "acquired": self.acquired,
+                "reused": self.reused,
+                "reuse_ratio": (self.reused / self.acquired) if self.acquired else None,
+                "in_use": self.in_use,
+                "max_in_use": self.max_in_use,
+                "idle": len(self._idle),
+                "max_idle": self.max_idle,
+                "cache_size_kib": self.cache_size_kib,
+                "mmap_size": self.mmap_size,
+                "cached_statements": self.cached_statements,
+            }
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Batch dispense planning for PillSyncOS.
+
+A dose that needs pills from several carousels is planned as a few
+"phases" of simultaneous moves instead of one /dispense per carousel:
+
+  • every motor's pills are merged into one move of `count` slots
+    (one ramp up / down instead of `count` separate moves); in a
+    phase each motor ramps down on its own, at the end of its own move
+  • motors that can share a timebase run in the same phase – with the
+    normal stepping loop that is every motor, because MotorArray merges
+    all nibbles into one frame per write
+  • burst moves stream into a single OLAT register, so motors on
+    different expander ports conflict and get a phase each
+
+The plan carries the expected finish time of every motor so the UI can
+show what a batch will cost before (and after) it runs.
+"""
+
+import time
+
+from functions.motor_array import WHOLESTEPS_PER_CALL, HALFSTEPS_PER_WHOLESTEP, SLOTS_PER_REV
+from functions.motion_profiles import get_profile
+from functions.drive_modes import get_drive_mode
+
+
+def _expected_finish(writes, delay, profile):
+    """Seconds from phase start until a motor making `writes` writes stops."""
+    if profile is None:
+        return writes * delay
+    return profile.duration(writes)
+
+
+def plan_batch(
+    motor_map,
+    items,
+    delay: float = 0.003,
+    profile=None,
+    drive_mode=None,
+    burst: bool = False,
+) -> dict:
+    """
+    Plan a multi-slot dispense.
+
+    :param motor_map: MotorArray.motor_map (motor_id → addr / port)
+    :param items: iterable of (motor_id, count) pairs; repeated motors add up
+                  (at most SLOTS_PER_REV per motor)
+    :return: {"phases": [...], "expected_duration": s, "sequential_duration": s}
+    """
+    profile = get_profile(profile)
+    mode = get_drive_mode(drive_mode)
+
+    counts = {}
+    for motor_id, count in items:
+        if motor_id not in motor_map:
+            raise ValueError(f"Motor {motor_id} not available on detected hardware")
+        if count < 1:
+            raise ValueError(f"Count for motor {motor_id} must be at least 1")
+        counts[motor_id] = counts.get(motor_id, 0) + count
+        # More than one revolution would pass the same slots twice
+        if counts[motor_id] > SLOTS_PER_REV:
+            raise ValueError(
+                f"Count for motor {motor_id} exceeds the {SLOTS_PER_REV} slots of one carousel"
+            )
+
+    # Group motors that may move together
+    groups = {}
+    for motor_id in counts:
+        key = (motor_map[motor_id]["addr"], motor_map[motor_id]["port"]) if burst else None
+        groups.setdefault(key, []).append(motor_id)
+
+    one_slot_writes = -(-WHOLESTEPS_PER_CALL * HALFSTEPS_PER_WHOLESTEP // mode.halfsteps_per_step)
+    one_slot_s = _expected_finish(one_slot_writes, delay, profile)
+
+    phases = []
+    start = 0.0
+    for motor_ids in groups.values():
+        half_steps = {mid: counts[mid] * WHOLESTEPS_PER_CALL * HALFSTEPS_PER_WHOLESTEP for mid in motor_ids}
+        writes = {mid: -(-n // mode.halfsteps_per_step) for mid, n in half_steps.items()}
+        duration = _expected_finish(max(writes.values()), delay, profile)
+        phases.append({
+            "start": start,
+            "expected_duration": duration,
+            "motors": [
+                {
+                    "motor_id": mid,
+                    "count": counts[mid],
+                    "half_steps": half_steps[mid],
+                    "expected_finish": start + _expected_finish(writes[mid], delay, profile),
+                }
+                for mid in motor_ids
+            ],
+        })
+        start += duration
+
+    return {
+        "phases": phases,
+        "expected_duration": start,
+        # What the same pills cost as one-slot /dispense calls in a row
+        "sequential_duration": sum(counts.values()) * one_slot_s,
+    }
+
+
+def run_batch(
+    motor_array,
+    plan: dict,
+    direction: int = 1,
+    delay: float = 0.003,
+    profile=None,
+    drive_mode=None,
+    burst: bool = False,
+) -> dict:
+    """
+    Execute a plan from plan_batch() on the motion thread.
+
+    Returns per-motor timings: the phase each motor ran in, its expected
+    finish and the measured start / end of that phase (seconds from the
+    start of the batch).
+    """
+    timings = {}
+    batch_start = time.monotonic()
+
+    for index, phase in enumerate(plan["phases"]):
+        phase_start = time.monotonic() - batch_start
+        motor_array.move_motors(
+            {m["motor_id"]: (direction, m["half_steps"]) for m in phase["motors"]},
+            delay=delay,
+            profile=profile,
+            drive_mode=drive_mode,
+            burst=burst,
+        )
+        phase_end = time.monotonic() - batch_start
+
+        for m in phase["motors"]:
+            timings[m["motor_id"]] = {
+                "phase": index,
+                "count": m["count"],
+                "expected_finish": m["expected_finish"],
+                "phase_started": phase_start,
+                "phase_finished": phase_end,
+                "step_timing": motor_array.last_move_stats,
+            }
+
+    return {
+        "motors": timings,
+        "elapsed": time.monotonic() - batch_start,
+    }
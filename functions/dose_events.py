@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+"""
+Dose occurrences for PillSyncOS.
+
+Every Active prescription is expanded into one row per dose per day in
+`dose_events`, so "what is due now" is an indexed range query on
+(due_at, state) instead of a scan of every prescription, and a daily
+medication fires again tomorrow instead of being retired after its
+first alarm.
+
+    pending ──alerted──▶ alerted ──dispensed──▶ dispensed
+        │                   │
+        └──── missed ◀──────┘      (not dispensed within WINDOW of due_at)
+
+Rows are generated for today and tomorrow (HORIZON_DAYS), topped up by
+roll_over() at midnight and rebuilt for one prescription by
+regenerate() when it is added or edited. due_at is local time stored as
+TEXT 'YYYY-MM-DD HH:MM:SS', so string order is time order – and a
+±WINDOW range across midnight (23:55 vs 00:05) is just a range.
+
+/check_alert is polled every few seconds by the kiosk, so open_doses
+keeps the open doses of the horizon as a sorted in-memory array and
+answers it with two bisects; every write in this module bumps a
+version number that makes the array reload on its next use.
+"""
+
+import threading
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta
+
+from functions import recurrence
+
+PENDING = "pending"
+ALERTED = "alerted"
+DISPENSED = "dispensed"
+MISSED = "missed"
+
+# Allowed source states for each transition
+TRANSITIONS = {
+    ALERTED: (PENDING,),
+    DISPENSED: (PENDING, ALERTED),
+    MISSED: (PENDING, ALERTED),
+}
+
+TIME_FMT = "%Y-%m-%d %H:%M:%S"
+
+# A dose can be alerted / dispensed this long either side of its time
+WINDOW = timedelta(minutes=15)
+
+# Days materialized ahead (today + tomorrow)
+HORIZON_DAYS = 2
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS dose_events (
+    event_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    prescription_id INTEGER NOT NULL,
+    user_id INTEGER,
+    due_at TEXT NOT NULL,
+    state TEXT NOT NULL DEFAULT 'pending',
+    alerted_at TEXT,
+    dispensed_at TEXT,
+    UNIQUE (prescription_id, due_at),
+    FOREIGN KEY (prescription_id) REFERENCES prescriptions(prescription_id) ON DELETE CASCADE
+);
+CREATE INDEX IF NOT EXISTS idx_dose_events_due_state ON dose_events (due_at, state);
+"""
+
+
+def fmt(dt: datetime) -> str:
+    return dt.strftime(TIME_FMT)
+
+
+def parse(text: str) -> datetime:
+    return datetime.strptime(text, TIME_FMT)
+
+
+def ensure_schema(db):
+    db.executescript(SCHEMA)
+    db.commit()
+
+
+_version = 0
+
+
+def _changed():
+    """Any dose_events write: cached views (open_doses) reload."""
+    global _version
+    _version += 1
+
+
+# -------------------------------------------------------------
+# Generation
+# -------------------------------------------------------------
+def occurrences_on(prescription, day) -> list:
+    """Dose times of one prescription on `day` (a date), from frequency + time_of_day."""
+    return recurrence.for_prescription(prescription).on(day)
+
+
+def _insert(db, prescription, days, not_before=None) -> int:
+    schedule = recurrence.for_prescription(prescription)
+    if not schedule.recognized:
+        print(f"[DoseEvents] Prescription {prescription['prescription_id']} not scheduled: "
+              f"{schedule.reason}")
+        return 0
+
+    rows = []
+    for day in days:
+        for due in schedule.on(day):
+            if not_before is None or due >= not_before:
+                rows.append((prescription["prescription_id"], prescription["user_id"], fmt(due)))
+    # UNIQUE(prescription_id, due_at): re-running a day never duplicates
+    before = db.total_changes
+    db.executemany(
+        "INSERT OR IGNORE INTO dose_events (prescription_id, user_id, due_at) VALUES (?, ?, ?)",
+        rows,
+    )
+    return db.total_changes - before
+
+
+def _horizon(now: datetime) -> list:
+    return [now.date() + timedelta(days=i) for i in range(HORIZON_DAYS)]
+
+
+def generate(db, days, prescription_id=None, not_before=None) -> int:
+    """Materialize `days` for every Active prescription (or just one)."""
+    # SELECT *: created_at (when the column exists) anchors every-N-days schedules
+    sql = "SELECT * FROM prescriptions WHERE status = 'Active'"
+    params = []
+    if prescription_id is not None:
+        sql += " AND prescription_id = ?"
+        params.append(prescription_id)
+
+    added = sum(_insert(db, p, days, not_before) for p in db.execute(sql, params).fetchall())
+    db.commit()
+    _changed()
+    return added
+
+
+def regenerate(db, prescription_id, now: datetime = None) -> int:
+    """
+    A prescription was added or edited: replace its future pending
+    doses. Doses already alerted / dispensed keep their history.
+    """
+    now = now or datetime.now()
+    db.execute(
+        "DELETE FROM dose_events WHERE prescription_id = ? AND state = ? AND due_at >= ?",
+        (prescription_id, PENDING, fmt(now - WINDOW)),
+    )
+    return generate(db, _horizon(now), prescription_id, not_before=now - WINDOW)
+
+
+def delete_for(db, prescription_id):
+    """The prescription is gone (SQLite only cascades with foreign_keys=ON)."""
+    db.execute("DELETE FROM dose_events WHERE prescription_id = ?", (prescription_id,))
+    db.commit()
+    _changed()
+
+
+def roll_over(db, now: datetime = None) -> dict:
+    """Midnight / start-up: top up the horizon and close out stale doses."""
+    now = now or datetime.now()
+    added = generate(db, _horizon(now), not_before=now - WINDOW)
+    missed = mark_missed(db, now)
+    print(f"[DoseEvents] Generated {added} doses through {_horizon(now)[-1]}, {missed} missed")
+    return {"added": added, "missed": missed}
+
+
+# -------------------------------------------------------------
+# Queries / transitions
+# -------------------------------------------------------------
+_EVENT_COLUMNS = (
+    "SELECT e.event_id, e.prescription_id, e.user_id, p.name, e.due_at, e.state "
+    "FROM dose_events e JOIN prescriptions p ON p.prescription_id = e.prescription_id "
+)
+
+
+def due_between(db, start: datetime, end: datetime, states=(PENDING,)) -> list:
+    """Events with start <= due_at <= end in `states`, oldest first."""
+    marks = ",".join("?" * len(states))
+    return db.execute(
+        _EVENT_COLUMNS
+        + f"WHERE e.due_at BETWEEN ? AND ? AND e.state IN ({marks}) ORDER BY e.due_at",
+        (fmt(start), fmt(end), *states),
+    ).fetchall()
+
+
+def nearest_open(db, now: datetime, prescription_id=None):
+    """The pending / alerted dose closest to `now` within ±WINDOW, or None."""
+    sql = _EVENT_COLUMNS + "WHERE e.due_at BETWEEN ? AND ? AND e.state IN (?, ?)"
+    params = [fmt(now - WINDOW), fmt(now + WINDOW), PENDING, ALERTED]
+    if prescription_id is not None:
+        sql += " AND e.prescription_id = ?"
+        params.append(prescription_id)
+    rows = db.execute(sql, params).fetchall()
+    return min(rows, key=lambda r: abs((parse(r["due_at"]) - now).total_seconds()), default=None)
+
+
+def mark(db, event_ids, state: str, now: datetime = None) -> int:
+    """Move events to `state` if the transition is allowed; returns rows changed."""
+    if not event_ids:
+        return 0
+    now = now or datetime.now()
+    sources = TRANSITIONS[state]
+    stamp_col = {ALERTED: ", alerted_at = ?", DISPENSED: ", dispensed_at = ?"}.get(state, "")
+    params = [state] + ([fmt(now)] if stamp_col else [])
+    cur = db.execute(
+        f"UPDATE dose_events SET state = ?{stamp_col} "
+        f"WHERE event_id IN ({','.join('?' * len(event_ids))}) "
+        f"AND state IN ({','.join('?' * len(sources))})",
+        (*params, *event_ids, *sources),
+    )
+    db.commit()
+    _changed()
+    return cur.rowcount
+
+
+def mark_missed(db, now: datetime = None) -> int:
+    """Every open dose whose window has closed becomes missed."""
+    now = now or datetime.now()
+    cur = db.execute(
+        "UPDATE dose_events SET state = ? WHERE due_at < ? AND state IN (?, ?)",
+        (MISSED, fmt(now - WINDOW), PENDING, ALERTED),
+    )
+    db.commit()
+    if cur.rowcount:
+        _changed()
+    return cur.rowcount
+
+
+# -------------------------------------------------------------
+# Cached window index (/check_alert)
+# -------------------------------------------------------------
+class OpenDoseIndex:
+    """Sorted open doses of the horizon; nearest() is two bisects."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._from = None
+        self._until = None
+        self._due = []      # sorted datetimes
+        self._rows = []     # event dicts, same order
+        self.loads = 0
+        self.hits = 0
+
+    def _load(self, db, now):
+        self._from = start = now - WINDOW
+        self._until = datetime.combine(now.date() + timedelta(days=HORIZON_DAYS), datetime.min.time())
+        rows = [dict(r) for r in due_between(db, start, self._until, (PENDING, ALERTED))]
+        self._due = [parse(r["due_at"]) for r in rows]
+        self._rows = rows
+        self._version = _version
+        self.loads += 1
+
+    def nearest(self, db, now: datetime = None):
+        """The open dose closest to `now` within ±WINDOW, or None."""
+        now = now or datetime.now()
+        with self._lock:
+            if (self._version != _version or now - WINDOW < self._from
+                    or now + WINDOW >= self._until):
+                self._load(db, now)
+            else:
+                self.hits += 1
+            lo = bisect_left(self._due, now - WINDOW)
+            hi = bisect_right(self._due, now + WINDOW)
+            if lo == hi:
+                return None
+            i = min(range(lo, hi), key=lambda k: abs(self._due[k] - now))
+            return self._rows[i]
+
+    def invalidate(self):
+        """Reload on next use (e.g. after rows went away by ON DELETE CASCADE)."""
+        with self._lock:
+            self._version = None
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"cached": len(self._due), "loads": self.loads, "hits": self.hits}
+
+
+open_doses = OpenDoseIndex()
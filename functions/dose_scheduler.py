@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Dose scheduler for PillSyncOS.
+
+Keeps a min-heap of upcoming dose events – (due, event_id) – and sleeps
+until the earliest one, instead of waking every minute and re-scanning
+every prescription:
+
+    load()          -> upcoming pending doses, [{"event_id", "due_at",
+                       "prescription_id", "user_id", "name"}, ...]
+                       (dose_events rows); called at start, after
+                       notify() and every MAX_SLEEP
+    on_due(doses)   -> every dose that came due in one wake-up, so doses
+                       sharing a time raise one alarm
+    roll_over(now)  -> called when the date changes, to generate the
+                       next day's events
+
+The Flask routes that add / change / delete prescriptions call
+notify(), which wakes the thread through its condition variable and
+makes it reload.
+"""
+
+import heapq
+import threading
+from datetime import datetime, timedelta
+
+# Never sleep longer than this in one go: the Pi has no RTC, so the wall
+# clock can jump (NTP sync after boot) while we wait. Each such wake-up
+# also reloads, which lets load() close out missed doses.
+MAX_SLEEP = 300.0
+
+
+class DoseScheduler(threading.Thread):
+    def __init__(self, load, on_due, roll_over=None, clock=datetime.now):
+        super().__init__(name="MedicationScheduler", daemon=True)
+        self._load = load
+        self._on_due = on_due
+        self._roll_over = roll_over
+        self._clock = clock
+        self._day = None
+
+        self._cond = threading.Condition()
+        self._heap = []
+        self._dirty = True
+        self._shutdown = False
+
+        self.reloads = 0
+        self.fired = 0
+
+    # -------------------------------------------------------------
+    # Control
+    # -------------------------------------------------------------
+    def notify(self):
+        """Prescriptions changed: reload the heap and re-plan the sleep."""
+        with self._cond:
+            self._dirty = True
+            self._cond.notify()
+
+    def shutdown(self):
+        with self._cond:
+            self._shutdown = True
+            self._cond.notify()
+
+    def next_due(self):
+        with self._cond:
+            return self._heap[0][0] if self._heap else None
+
+    def status(self) -> dict:
+        with self._cond:
+            upcoming = heapq.nsmallest(5, self._heap)
+            return {
+                "scheduled": len(self._heap),
+                "next": [
+                    {**dose, "due_at": due.strftime("%Y-%m-%d %H:%M:%S")}
+                    for due, _, dose in upcoming
+                ],
+                "reloads": self.reloads,
+                "fired": self.fired,
+            }
+
+    # -------------------------------------------------------------
+    # Heap
+    # -------------------------------------------------------------
+    def _rebuild(self):
+        heap = []
+        for dose in self._load():
+            due = dose["due_at"]
+            if isinstance(due, str):
+                due = datetime.strptime(due, "%Y-%m-%d %H:%M:%S")
+            heap.append((due, dose["event_id"], dose))
+        heapq.heapify(heap)
+        self._heap = heap
+        self._dirty = False
+        self.reloads += 1
+        print(f"[DoseScheduler] {len(heap)} doses scheduled; next at "
+              f"{heap[0][0].strftime('%Y-%m-%d %H:%M') if heap else '-'}")
+
+    def _pop_due(self, now):
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            due.append(heapq.heappop(self._heap)[2])
+        return due
+
+    def _check_day(self, now):
+        if now.date() == self._day:
+            return
+        if self._day is not None and self._roll_over is not None:
+            try:
+                self._roll_over(now)
+            except Exception as e:
+                print(f"[DoseScheduler] Roll-over failed: {e}")
+        self._day = now.date()
+        self._dirty = True
+
+    # -------------------------------------------------------------
+    # Worker
+    # -------------------------------------------------------------
+    def run(self):
+        print("[DoseScheduler] Started")
+        while True:
+            with self._cond:
+                if self._shutdown:
+                    break
+                self._check_day(self._clock())
+                if self._dirty:
+                    try:
+                        self._rebuild()
+                    except Exception as e:
+                        print(f"[DoseScheduler] Reload failed: {e}")
+                        self._cond.wait(10)
+                        continue
+
+                now = self._clock()
+                due = self._pop_due(now)
+                if not due:
+                    timeout = MAX_SLEEP
+                    if self._heap:
+                        timeout = min(timeout, (self._heap[0][0] - now).total_seconds())
+                    midnight = datetime.combine(now.date() + timedelta(days=1), datetime.min.time())
+                    timeout = min(timeout, (midnight - now).total_seconds())
+                    if not self._cond.wait(max(0.0, timeout)) and timeout == MAX_SLEEP:
+                        self._dirty = True
+                    continue
+
+            # Outside the lock: the callback may touch the DB and call notify()
+            self.fired += len(due)
+            try:
+                self._on_due(due)
+            except Exception as e:
+                print(f"[DoseScheduler] on_due failed: {e}")
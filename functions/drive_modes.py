@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Stepper drive modes for PillSyncOS.
+
+All modes are expressed on the 8-state half-step table SEQ, so a motor's
+journaled phase (an index into SEQ) stays valid whichever mode moved it:
+
+  half  – every SEQ entry, 1 half-step of angle per write (original)
+  full  – two-phase full-step, the odd SEQ entries (two coils on),
+          2 half-steps of angle per write, highest torque
+  wave  – one-phase full-step, the even SEQ entries (one coil on),
+          2 half-steps of angle per write, lowest current
+
+A full/wave move that starts on the "wrong" parity takes one half-step
+first to land on its table, so distances (and WHOLESTEPS_PER_CALL) mean
+the same angle in every mode.
+
+A mode only decides how far each write advances the phase (advance());
+the coil pattern for a phase is always SEQ[phase], including the odd
+half-step a full/wave move takes to land on (or finish off) its table.
+So every mode shares SEQ_BYTES – each SEQ entry pre-shifted for both
+nibbles – and the stepping loop looks up latch bytes instead of masking
+and shifting patterns per write.
+"""
+
+from typing import Union
+
+# Half-step sequence (original from test script)
+SEQ = [
+    0b0001, 0b0011, 0b0010, 0b0110,
+    0b0100, 0b1100, 0b1000, 0b1001
+]
+
+# shift → latch byte for each SEQ index
+SEQ_BYTES = {
+    shift: tuple((p & 0x0F) << shift for p in SEQ)
+    for shift in (0, 4)
+}
+
+
+class DriveMode:
+    def __init__(self, name: str, parity=None):
+        """
+        :param name: mode name
+        :param parity: None for half-stepping, else the SEQ index parity
+                       (0 = even / wave, 1 = odd / two-phase) this mode uses
+        """
+        self.name = name
+        self.parity = parity
+        self.halfsteps_per_step = 1 if parity is None else 2
+
+    def advance(self, phase: int, remaining_halfsteps: int) -> int:
+        """Half-steps the next write moves from `phase` (1 or 2)."""
+        if self.parity is None or remaining_halfsteps < 2:
+            return 1
+        if phase % 2 == self.parity:
+            return 2
+        return 1   # land on this mode's table first
+
+    def writes_needed(self, phase: int, halfsteps: int) -> int:
+        """Number of coil writes to cover `halfsteps` starting at `phase`."""
+        if self.parity is None or halfsteps < 2:
+            return max(0, halfsteps)
+        snap = 0 if phase % 2 == self.parity else 1
+        rest = halfsteps - snap
+        return snap + rest // 2 + rest % 2
+
+    def __repr__(self):
+        return f"DriveMode({self.name!r})"
+
+
+DRIVE_MODES = {
+    "half": DriveMode("half"),
+    "full": DriveMode("full", parity=1),
+    "wave": DriveMode("wave", parity=0),
+}
+
+DEFAULT_DRIVE_MODE = "half"
+
+
+def get_drive_mode(mode: Union[str, DriveMode, None]) -> DriveMode:
+    if mode is None:
+        return DRIVE_MODES[DEFAULT_DRIVE_MODE]
+    if isinstance(mode, DriveMode):
+        return mode
+    try:
+        return DRIVE_MODES[mode]
+    except KeyError:
+        raise ValueError(
+            f"Unknown drive mode {mode!r} (choose from {', '.join(DRIVE_MODES)})"
+        )
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+Hardware arbitration for PillSyncOS.
+
+CoreController is shared by Flask's request threads and the medication
+scheduler. MotionController already runs every move on one thread; the
+arbiter decides what may be queued there in the first place:
+
+ • per-motor locks – a motor is claimed from the moment a dispense /
+   homing job is accepted until that job finishes, so two requests can
+   never stack moves on the same carousel
+ • a bus lock – held by the motion thread while a job drives the I2C
+   bus; anything else touching the bus takes it too
+ • fair queuing – waiters are served strictly first come, first served
+ • timeouts – a request that cannot get its motors (or finds too many
+   jobs queued) fails fast with HardwareBusy instead of parking a
+   thread. Motor claims last for a whole move, so request handlers
+   claim with timeout 0 (MOTOR_CLAIM_TIMEOUT): a motor that is moving
+   is "busy" right away, never "wait for the move, then succeed"
+
+Every lock keeps acquisition / timeout counts and wait times, and
+stats() adds the current queue depth, for the /motor_stats endpoint.
+"""
+
+import threading
+import time
+from collections import deque
+
+# How long a request waits for its motors before reporting "busy"
+# (0: don't wait – a claimed motor is in the middle of a move)
+DEFAULT_CLAIM_TIMEOUT = 0.0
+
+# Motion jobs allowed to wait in the queue before requests get "busy"
+DEFAULT_MAX_PENDING = 8
+
+
+class HardwareBusy(Exception):
+    pass
+
+
+class FairLock:
+    """Non-reentrant FIFO lock with timeouts and wait statistics."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._cond = threading.Condition()
+        self._waiters = deque()
+        self._locked = False
+        self.holder = None
+
+        self.acquisitions = 0
+        self.timeouts = 0
+        self.total_wait_s = 0.0
+        self.max_wait_s = 0.0
+
+    def acquire(self, timeout: float = None, holder=None) -> bool:
+        ticket = object()
+        start = time.monotonic()
+        deadline = None if timeout is None else start + timeout
+
+        with self._cond:
+            self._waiters.append(ticket)
+            while self._locked or self._waiters[0] is not ticket:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    self._waiters.remove(ticket)
+                    self.timeouts += 1
+                    self._cond.notify_all()   # the next waiter may now be first
+                    return False
+                self._cond.wait(remaining)
+
+            self._waiters.popleft()
+            self._locked = True
+            self.holder = holder
+
+            waited = time.monotonic() - start
+            self.acquisitions += 1
+            self.total_wait_s += waited
+            self.max_wait_s = max(self.max_wait_s, waited)
+            return True
+
+    def release(self):
+        with self._cond:
+            if not self._locked:
+                raise RuntimeError(f"FairLock {self.name} released while unlocked")
+            self._locked = False
+            self.holder = None
+            self._cond.notify_all()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "locked": self._locked,
+                "holder": self.holder,
+                "waiting": len(self._waiters),
+                "acquisitions": self.acquisitions,
+                "timeouts": self.timeouts,
+                "mean_wait_s": (self.total_wait_s / self.acquisitions) if self.acquisitions else None,
+                "max_wait_s": self.max_wait_s,
+            }
+
+
+class MotorClaim:
+    """Motor locks held for one job; release() is idempotent."""
+
+    def __init__(self, arbiter, motor_ids, label):
+        self.arbiter = arbiter
+        self.motor_ids = motor_ids
+        self.label = label
+        self._released = False
+        self._lock = threading.Lock()
+
+    def release(self, *_):
+        # Also usable as a Future done-callback
+        with self._lock:
+            if self._released:
+                return
+            self._released = True
+        for mid in reversed(self.motor_ids):
+            self.arbiter.motor_lock(mid).release()
+
+
+class HardwareArbiter:
+    def __init__(self, claim_timeout: float = DEFAULT_CLAIM_TIMEOUT,
+                 max_pending: int = DEFAULT_MAX_PENDING, pending=None):
+        """
+        :param claim_timeout: default seconds to wait for motor locks
+        :param max_pending: queued motion jobs allowed before "busy"
+        :param pending: callable returning the current motion queue depth
+        """
+        self.claim_timeout = claim_timeout
+        self.max_pending = max_pending
+        self.pending = pending or (lambda: 0)
+
+        self.bus = FairLock("bus")
+        self._motors = {}
+        self._motors_lock = threading.Lock()
+        self.busy_rejections = 0
+
+    def motor_lock(self, motor_id) -> FairLock:
+        with self._motors_lock:
+            lock = self._motors.get(motor_id)
+            if lock is None:
+                lock = self._motors[motor_id] = FairLock(f"motor{motor_id}")
+            return lock
+
+    def claim(self, motor_ids, label: str = None, timeout: float = None) -> MotorClaim:
+        """
+        Lock `motor_ids` for one job (sorted order, so claims never deadlock).
+
+        Raises HardwareBusy if the queue is full or the motors are not
+        free within `timeout` seconds.
+        """
+        if self.pending() >= self.max_pending:
+            self.busy_rejections += 1
+            raise HardwareBusy(f"Motion queue full ({self.max_pending} jobs); try again shortly")
+
+        timeout = self.claim_timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        motor_ids = sorted(set(motor_ids))
+        acquired = []
+
+        for mid in motor_ids:
+            lock = self.motor_lock(mid)
+            if not lock.acquire(max(0.0, deadline - time.monotonic()), holder=label):
+                for held in reversed(acquired):
+                    self.motor_lock(held).release()
+                self.busy_rejections += 1
+                raise HardwareBusy(f"Motor {mid} is busy ({lock.holder or 'in use'}); try again shortly")
+            acquired.append(mid)
+
+        return MotorClaim(self, motor_ids, label)
+
+    def stats(self) -> dict:
+        with self._motors_lock:
+            motors = dict(self._motors)
+        return {
+            "queue_depth": self.pending(),
+            "max_pending": self.max_pending,
+            "busy_rejections": self.busy_rejections,
+            "bus": self.bus.stats(),
+            "motors": {mid: lock.stats() for mid, lock in sorted(motors.items())},
+        }
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+MCP23017 bus layer for PillSyncOS.
+
+Wraps an SMBus handle and keeps a cached copy of each expander's
+OLATA/OLATB latches. Port updates are written as:
+
+ • nothing at all if both latches already hold the requested value
+ • one byte write if only one latch changes
+ • one sequential block write (OLATA then OLATB) if both change
+
+Sequential addressing (IOCON.SEQOP = 0, BANK = 0) is forced during
+init_expander() so the block write lands on OLATA and OLATB.
+
+burst() streams many latch values for one port in a single plain-I2C
+write. Sequential addressing is switched off (SEQOP = 1) for the burst
+and restored afterwards. In that byte mode with BANK = 0 the chip's
+address pointer toggles between OLATA and OLATB, so every value goes
+out as an [OLATA, OLATB] pair, with the other port's cached latch byte
+filling its half. That is 2 × 9 SCL clocks per value, so the bus clock
+sets the step rate.
+"""
+
+try:
+    from smbus2 import i2c_msg
+except ImportError:
+    i2c_msg = None
+
+# MCP23017 registers (IOCON.BANK = 0)
+IODIRA = 0x00
+IODIRB = 0x01
+IOCON  = 0x0A
+OLATA  = 0x14
+OLATB  = 0x15
+
+IOCON_SEQOP = 0x20
+
+# burst(): wire bytes per latch value ([OLATA, OLATB] pair)
+BURST_BYTES_PER_VALUE = 2
+
+# Largest single I2C write issued by burst() (register byte excluded;
+# kept a multiple of BURST_BYTES_PER_VALUE so every chunk starts on OLATA)
+BURST_CHUNK_BYTES = 4096
+
+
+class _WriteMsg:
+    """Minimal stand-in for smbus2.i2c_msg.write() (used with SimSMBus)."""
+
+    def __init__(self, addr, data):
+        self.addr = addr
+        self.buf = bytes(data)
+        self.len = len(self.buf)
+
+    def __iter__(self):
+        return iter(self.buf)
+
+
+def _write_msg(addr, data):
+    if i2c_msg is not None:
+        return i2c_msg.write(addr, data)
+    return _WriteMsg(addr, data)
+
+
+class MCP23017Bus:
+    def __init__(self, bus):
+        self.bus = bus
+
+        # addr → [OLATA, OLATB] as last written to the chip
+        self._olat = {}
+        self._iocon = {}
+
+        # Transaction accounting
+        self.transactions = 0
+        self.skipped_writes = 0
+
+    # -------------------------------------------------------------
+    # Setup
+    # -------------------------------------------------------------
+    def probe(self, addr) -> bool:
+        try:
+            self.bus.write_byte(addr, 0x00)
+            return True
+        except Exception:
+            return False
+
+    def init_expander(self, addr):
+        """All pins output, sequential addressing, both latches low."""
+        self.bus.write_byte_data(addr, IOCON, 0x00)
+        self.bus.write_i2c_block_data(addr, IODIRA, [0x00, 0x00])
+        self.bus.write_i2c_block_data(addr, OLATA, [0x00, 0x00])
+        self.transactions += 3
+        self._olat[addr] = [0x00, 0x00]
+        self._iocon[addr] = 0x00
+
+    # -------------------------------------------------------------
+    # Latch access
+    # -------------------------------------------------------------
+    def olat(self, addr, port) -> int:
+        return self._olat[addr][0 if port == "A" else 1]
+
+    def write_olat(self, addr, a=None, b=None):
+        """
+        Update OLATA and/or OLATB on one expander.
+
+        A value of None leaves that latch untouched. Writes that match
+        the cached latch are skipped.
+        """
+        cached = self._olat[addr]
+        new_a = cached[0] if a is None else a & 0xFF
+        new_b = cached[1] if b is None else b & 0xFF
+
+        change_a = new_a != cached[0]
+        change_b = new_b != cached[1]
+
+        if change_a and change_b:
+            self.bus.write_i2c_block_data(addr, OLATA, [new_a, new_b])
+        elif change_a:
+            self.bus.write_byte_data(addr, OLATA, new_a)
+        elif change_b:
+            self.bus.write_byte_data(addr, OLATB, new_b)
+        else:
+            self.skipped_writes += 1
+            return
+
+        self.transactions += 1
+        cached[0] = new_a
+        cached[1] = new_b
+
+    # -------------------------------------------------------------
+    # Burst streaming
+    # -------------------------------------------------------------
+    def _set_seqop(self, addr, disabled: bool):
+        value = (self._iocon[addr] | IOCON_SEQOP) if disabled else (self._iocon[addr] & ~IOCON_SEQOP)
+        if value != self._iocon[addr]:
+            self.bus.write_byte_data(addr, IOCON, value)
+            self.transactions += 1
+            self._iocon[addr] = value
+
+    def burst(self, addr, port, data, chunk_bytes: int = BURST_CHUNK_BYTES, on_chunk=None):
+        """
+        Stream the latch values `data` into OLATA or OLATB with as few
+        I2C writes as possible.
+
+        Each value is sent as an [OLATA, OLATB] pair (byte mode toggles
+        the pointer within the pair); the other port is held at its
+        cached latch byte. `on_chunk(values_sent)` is called after every
+        chunk so the caller can track progress. The latch cache ends on
+        the last value sent.
+        """
+        if not data:
+            return
+
+        index = 0 if port == "A" else 1
+        other = self._olat[addr][1 - index]
+        values_per_chunk = max(1, chunk_bytes // BURST_BYTES_PER_VALUE)
+        sent = 0
+
+        self._set_seqop(addr, disabled=True)
+        try:
+            while sent < len(data):
+                chunk = data[sent:sent + values_per_chunk]
+                payload = [OLATA]
+                for value in chunk:
+                    if index == 0:
+                        payload += (value & 0xFF, other)
+                    else:
+                        payload += (other, value & 0xFF)
+                self.bus.i2c_rdwr(_write_msg(addr, payload))
+                self.transactions += 1
+                sent += len(chunk)
+                self._olat[addr][index] = chunk[-1] & 0xFF
+                if on_chunk is not None:
+                    on_chunk(sent)
+        finally:
+            self._set_seqop(addr, disabled=False)
+
+    def stats(self) -> dict:
+        return {
+            "transactions": self.transactions,
+            "skipped_writes": self.skipped_writes,
+        }
+
+    def close(self):
+        self.bus.close()
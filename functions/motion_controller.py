@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""
+Motion controller thread for PillSyncOS.
+
+One background thread owns the MotorArray (and therefore the SMBus).
+Everything else submits move jobs and gets a concurrent.futures.Future
+back, so two Flask request threads can never interleave coil writes.
+
+Jobs are taken from a priority queue:
+    homing   (0)  – runs first, carousel positions depend on it
+    dispense (1)
+    test     (2)  – demo / diagnostic moves
+Jobs of equal priority run in submission order.
+
+Every job is also kept in a bounded job table (the newest
+JOB_TABLE_SIZE finished jobs plus everything queued / running) so the
+web side can poll its state, percent of steps done and timing by id
+instead of holding a request open for the whole move.
+
+Usage:
+    controller = MotionController(motor_array)
+    controller.start()
+    fut = controller.submit("dispense", lambda ma: ma.step_motor(1))
+    fut.result()      # wait, or keep the future and return immediately
+    controller.job_status(fut.job_id)
+"""
+
+import itertools
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future
+
+JOB_PRIORITIES = {
+    "homing": 0,
+    "dispense": 1,
+    "test": 2,
+}
+
+# Stop sentinel sorts ahead of every real job
+_STOP_PRIORITY = -1
+
+# Finished jobs kept for status polling (oldest dropped first)
+JOB_TABLE_SIZE = 50
+
+
+class MotionJob:
+    def __init__(self, kind, priority, seq, fn, args=(), kwargs=None, info=None):
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.priority = priority
+        self.seq = seq
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs or {}
+        self.info = info or {}
+        self.future = Future()
+        self.future.job_id = self.id
+
+        self.state = "queued"
+        self.submitted_at = time.time()
+        self.started_ns = None
+        self.finished_ns = None
+        self.error = None
+        self.result = None
+        self.timing = None
+
+        # [done, total] coil writes per move, fed by MotorArray.progress_hook
+        self.moves = []
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+    def progress(self, done, total):
+        if done == 0 or not self.moves:
+            self.moves.append([done, total])
+        else:
+            self.moves[-1] = [done, total]
+
+    def status(self) -> dict:
+        done = sum(m[0] for m in self.moves)
+        total = sum(m[1] for m in self.moves)
+        if self.state == "done":
+            percent = 100.0
+        else:
+            percent = round(100.0 * done / total, 1) if total else 0.0
+
+        elapsed = None
+        if self.started_ns is not None:
+            end = self.finished_ns or time.monotonic_ns()
+            elapsed = (end - self.started_ns) / 1e9
+
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "state": self.state,
+            "percent": percent,
+            "steps_done": done,
+            "steps_total": total,
+            "moves": len(self.moves),
+            "submitted_at": self.submitted_at,
+            "elapsed_s": elapsed,
+            "error": self.error,
+            "result": self.result,
+            "timing": self.timing,
+            **self.info,
+        }
+
+
+class JobTable:
+    """Jobs by id; finished jobs beyond `size` are evicted oldest first."""
+
+    def __init__(self, size: int = JOB_TABLE_SIZE):
+        self.size = size
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, job):
+        with self._lock:
+            self._jobs[job.id] = job
+            self._evict()
+
+    def _evict(self):
+        finished = [jid for jid, j in self._jobs.items() if j.state in ("done", "failed", "cancelled")]
+        for jid in finished[:max(0, len(finished) - self.size)]:
+            del self._jobs[jid]
+
+    def finished(self, job):
+        with self._lock:
+            self._evict()
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self):
+        with self._lock:
+            return list(self._jobs.values())
+
+
+class MotionController(threading.Thread):
+    def __init__(self, motor_array, bus_lock=None):
+        """
+        :param bus_lock: optional lock (e.g. HardwareArbiter.bus) held
+                         while a job drives the bus
+        """
+        super().__init__(name="MotionController", daemon=True)
+        self.motor_array = motor_array
+        self.bus_lock = bus_lock
+        self._queue = queue.PriorityQueue()
+        self._seq = itertools.count()
+        self._stopping = threading.Event()
+        self.current_job = None
+        self.jobs = JobTable()
+
+    # -------------------------------------------------------------
+    # Submission
+    # -------------------------------------------------------------
+    def submit(self, kind, fn, *args, job_info=None, **kwargs) -> Future:
+        """
+        Queue `fn(motor_array, *args, **kwargs)` to run on the motion thread.
+
+        `job_info` (e.g. {"motor_id": 3}) is merged into the job's status.
+        The returned Future has a `job_id` attribute for job_status().
+        """
+        if kind not in JOB_PRIORITIES:
+            raise ValueError(f"Unknown motion job kind {kind!r}")
+        if self._stopping.is_set():
+            raise RuntimeError("MotionController is stopped")
+
+        job = MotionJob(kind, JOB_PRIORITIES[kind], next(self._seq), fn, args, kwargs, job_info)
+        self.jobs.add(job)
+        self._queue.put(job)
+        return job.future
+
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def job_status(self, job_id):
+        """Status dict of a queued / running / recent job, or None."""
+        job = self.jobs.get(job_id)
+        return None if job is None else job.status()
+
+    def job_list(self):
+        return [job.status() for job in self.jobs.list()]
+
+    # -------------------------------------------------------------
+    # Worker loop
+    # -------------------------------------------------------------
+    def run(self):
+        while True:
+            job = self._queue.get()
+            if job.kind == "stop":
+                break
+
+            if not job.future.set_running_or_notify_cancel():
+                job.state = "cancelled"
+                self.jobs.finished(job)
+                continue
+
+            self.current_job = job
+            if self.bus_lock is not None:
+                self.bus_lock.acquire(holder=f"{job.kind}:{job.id}")
+            # started_ns first: a status() that sees "running" also sees a start time
+            job.started_ns = time.monotonic_ns()
+            job.state = "running"
+            self.motor_array.progress_hook = job.progress
+            error = None
+            try:
+                result = job.fn(self.motor_array, *job.args, **job.kwargs)
+            except BaseException as e:
+                error = e
+            finally:
+                self.motor_array.progress_hook = None
+                self.current_job = None
+                if self.bus_lock is not None:
+                    self.bus_lock.release()
+
+            # Status is complete before the Future wakes any waiter
+            job.finished_ns = time.monotonic_ns()
+            if job.moves:
+                job.timing = self.motor_array.last_move_stats
+            if error is not None:
+                job.state = "failed"
+                job.error = str(error)
+                job.future.set_exception(error)
+            else:
+                job.state = "done"
+                job.result = result
+                job.future.set_result(result)
+            self.jobs.finished(job)
+
+        # Cancel anything still queued and release the hardware
+        while True:
+            try:
+                job = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            job.future.cancel()
+            job.state = "cancelled"
+
+        if self.bus_lock is not None:
+            self.bus_lock.acquire(holder="shutdown")
+        try:
+            self.motor_array.close()
+        except Exception as e:
+            print(f"[MotionController] close failed: {e}")
+        finally:
+            if self.bus_lock is not None:
+                self.bus_lock.release()
+
+    def stop(self, timeout: float = None):
+        """Finish the running job, cancel queued ones, close the MotorArray."""
+        if self._stopping.is_set():
+            return
+        self._stopping.set()
+        self._queue.put(MotionJob("stop", _STOP_PRIORITY, -1, None))
+        if self.is_alive():
+            self.join(timeout)
@@ -1,14 +1,62 @@
 #!/usr/bin/env python3
 """
 Motor Array Controller for PillSyncOS
-Controls 28BYJ-48 stepper motors using one or two MCP23017 expanders.
+Controls 28BYJ-48 stepper motors using up to eight MCP23017 expanders.
 
 Auto-detects which expanders are present:
  - Board 1 → I2C addr 0x20
  - Board 2 → I2C addr 0x21 (only used if physically present)
-
-Each motor uses one nibble (4 bits):
-  GPA0–3, GPA4–7, GPB0–3 per board.
+ - ... up to 0x27 for larger installs
+
+The whole 0x20–0x27 range is probed in one pass and the result is cached
+(data/expanders.json); later startups only re-check the cached boards
+and fall back to a full probe if one of them stopped answering.
+
+Each motor uses one nibble (4 bits). The motor map is generated from the
+detected addresses and a wiring spec (nibbles used per board, in motor
+order). The default spec is GPA0–3, GPA4–7, GPB0–3 per board (3 motors);
+FULL_WIRING adds GPB4–7 (4 motors). Motor numbers follow the board's
+address, so motor 4 is always the first motor on 0x21 for 3-per-board.
+
+Port writes go through a per-expander shadow of OLATA/OLATB, so driving
+one motor never clobbers the other nibble on the same port. Several
+motors can be stepped in the same timebase with step_motors(); each
+half-step is then merged into one register write per port ("frame").
+
+Half-steps are scheduled against absolute monotonic deadlines (late
+steps catch up instead of drifting); per-move timing statistics are
+kept in last_move_stats / move_stats (see step_timing.py). In a
+multi-motor move every motor follows the motion profile for its own
+length (move_timeline()), so a shorter move ramps down to a stop
+instead of being cut off at cruise speed; writes that fall within
+COALESCE_NS of each other still share one frame.
+
+Each motor's half-step phase and carousel position are journaled to
+disk before and after every move (see position_journal.py), so a
+restart resumes where the motors stopped instead of re-homing. The
+journal is keyed by expander / port / nibble, not motor id, so a
+MOTORS_PER_EXPANDER change cannot hand a position to another carousel.
+
+Moves can use half-step (default), two-phase full-step or wave drive
+(see drive_modes.py). Step counts stay in half-steps of angle, so
+WHOLESTEPS_PER_CALL is the same rotation in every mode; full-step
+needs half the coil writes.
+
+Burst mode (burst=True) precomputes a whole move into latch values and
+streams them to the expander in byte mode (sequential addressing off).
+The MCP23017 then toggles between OLATA and OLATB, so each value goes
+out as an [OLATA, OLATB] pair with the other port held as it is. Each
+step's dwell becomes repeated pairs (18 SCL clocks each), so the bus
+clock – not Python's sleep – sets the step rate. All motors of a burst
+move must share one expander port.
+
+The I2C bus is pluggable: pass `bus=` (anything with the smbus2.SMBus
+methods used here, e.g. functions/sim/mcp23017_sim.SimSMBus) to run
+without hardware.
+
+All register traffic goes through MCP23017Bus (mcp23017_bus.py), which
+writes OLATA+OLATB in one block transaction and drops writes that would
+not change the latch.
 
 Each dispense call:
  • Rotates exactly 320 "whole steps"
@@ -19,39 +67,136 @@ MODIFIED:
  • Global motor direction reversed (CW → CCW)
 """
 
+import json
+import os
 import time
-from smbus2 import SMBus
+from bisect import bisect_right
+from itertools import repeat
+
+try:
+    from smbus2 import SMBus
+except ImportError:
+    SMBus = None
 
-# MCP23017 registers
-IODIRA = 0x00
-IODIRB = 0x01
-OLATA  = 0x14
-OLATB  = 0x15
+from .mcp23017_bus import MCP23017Bus, IODIRA, IODIRB, OLATA, OLATB, BURST_BYTES_PER_VALUE
+from .motion_profiles import get_profile
+from .step_timing import StepTimingStats
+from .position_journal import PositionJournal, JOURNAL_PATH
+from .drive_modes import SEQ, SEQ_BYTES, get_drive_mode
 
-# Two expanders (board 2 optional)
+# Expander addresses (A2..A0 straps); board 1 is always 0x20
 ADDR_BOARD1 = 0x20
 ADDR_BOARD2 = 0x21
+EXPANDER_ADDRS = range(0x20, 0x28)
+
+DETECT_CACHE_PATH = "data/expanders.json"
+
+# Wiring specs: (port, shift) of each motor nibble on a board, in order
+DEFAULT_WIRING = [("A", 0), ("A", 4), ("B", 0)]
+FULL_WIRING = [("A", 0), ("A", 4), ("B", 0), ("B", 4)]
+
+
+def build_motor_map(addrs, wiring=DEFAULT_WIRING):
+    """
+    Generate {motor_id: {"addr", "port", "shift"}} for the given boards.
 
-# Half-step sequence (original from test script)
-SEQ = [
-    0b0001, 0b0011, 0b0010, 0b0110,
-    0b0100, 0b1100, 0b1000, 0b1001
-]
-
-# Master motor map (filtered after detection)
-MOTOR_MAP_TEMPLATE = {
-    1: {"addr": ADDR_BOARD1, "port": "A", "shift": 0},
-    2: {"addr": ADDR_BOARD1, "port": "A", "shift": 4},
-    3: {"addr": ADDR_BOARD1, "port": "B", "shift": 0},
-    4: {"addr": ADDR_BOARD2, "port": "A", "shift": 0},
-    5: {"addr": ADDR_BOARD2, "port": "A", "shift": 4},
-    6: {"addr": ADDR_BOARD2, "port": "B", "shift": 0},
-}
+    `wiring` is a list of (port, shift) used on every board, or a dict
+    {addr: [(port, shift), ...]} for mixed installs. Motor ids are
+    numbered by board slot (addr - 0x20), so ids stay stable when a
+    board in the middle of the range is missing – but not when the
+    number of motors per board changes, which is why per-motor state on
+    disk is keyed by wiring (position_journal.wiring_key).
+    """
+    if isinstance(wiring, dict):
+        per_board = max(len(w) for w in wiring.values()) if wiring else 0
+    else:
+        per_board = len(wiring)
+
+    motor_map = {}
+    for addr in sorted(addrs):
+        board_wiring = wiring.get(addr, []) if isinstance(wiring, dict) else wiring
+        board = addr - ADDR_BOARD1
+        for i, (port, shift) in enumerate(board_wiring):
+            motor_map[board * per_board + i + 1] = {"addr": addr, "port": port, "shift": shift}
+    return motor_map
+
+
+# Master motor map for the classic two-board install
+MOTOR_MAP_TEMPLATE = build_motor_map([ADDR_BOARD1, ADDR_BOARD2])
 
 # Step definitions
 HALFSTEPS_PER_WHOLESTEP = 2
 WHOLESTEPS_PER_CALL = 558
 MAX_CALLS_PER_MOTOR = 7
+SLOTS_PER_REV = 7
+HALFSTEPS_PER_SLOT = WHOLESTEPS_PER_CALL * HALFSTEPS_PER_WHOLESTEP
+HALFSTEPS_PER_REV = SLOTS_PER_REV * HALFSTEPS_PER_SLOT
+
+# progress_hook(done, total) is called every this many coil writes
+PROGRESS_EVERY = 32
+
+# Burst mode: I2C clock and wire cost of one byte (8 data bits + ACK)
+DEFAULT_I2C_BUS_HZ = 100_000
+I2C_BITS_PER_BYTE = 9
+
+# Deadline scheduling: a step later than this is not caught up; the
+# schedule restarts from "now" instead of bursting steps into the coils.
+MAX_CATCHUP_NS = 10_000_000
+
+# Multi-motor moves: writes of different motors this close together go
+# out in one frame (well under the shortest dwell of any profile)
+COALESCE_NS = 100_000
+
+
+def move_timeline(write_counts: dict, delay: float = 0.003, profile=None) -> list:
+    """
+    Merged write schedule of a multi-motor move.
+
+    `write_counts` maps motor_id → coil writes. Each motor runs the
+    profile for its own write count (full ramp up and down). Returns
+    [(t_ns, [motor_id, ...]), ...] in time order, t_ns from the start of
+    the move; a motor's last entry (after its final dwell) is where it
+    is de-energized.
+    """
+    events = []
+    for mid, writes in write_counts.items():
+        delays = repeat(delay, writes) if profile is None else profile.delays(writes)
+        t = 0
+        events.append((0, 0, mid))
+        for k, dwell in enumerate(delays, 1):
+            t += int(dwell * 1e9)
+            events.append((t, k, mid))
+    # Ties (delay=0) go round-robin, so motors still move together
+    events.sort()
+
+    timeline = []
+    for t, _, mid in events:
+        if timeline and t - timeline[-1][0] <= COALESCE_NS and mid not in timeline[-1][1]:
+            timeline[-1][1].append(mid)
+        else:
+            timeline.append((t, [mid]))
+    return timeline
+
+
+def estimate_move_duration(
+    whole_steps: int = WHOLESTEPS_PER_CALL,
+    delay: float = 0.003,
+    profile=None,
+    drive_mode=None,
+) -> float:
+    """
+    Expected move time in seconds for a step_motor() call.
+
+    Pure calculation (no bus access), so MotorDriverClient can answer it
+    without a round-trip. `delay` and profile rates are per coil write,
+    so full-step and wave moves take about half as long as half-stepping.
+    """
+    mode = get_drive_mode(drive_mode)
+    writes = -(-whole_steps * HALFSTEPS_PER_WHOLESTEP // mode.halfsteps_per_step)
+    profile = get_profile(profile)
+    if profile is None:
+        return writes * delay
+    return profile.duration(writes)
 
 
 class MotorLimitReached(Exception):
@@ -60,22 +205,46 @@ class MotorLimitReached(Exception):
 
 
 class MotorArray:
-    def __init__(self, bus_num: int = 1):
-        self.bus = SMBus(bus_num)
+    def __init__(
+        self,
+        bus_num: int = 1,
+        journal_path: str = JOURNAL_PATH,
+        bus=None,
+        wiring=DEFAULT_WIRING,
+        detect_cache_path: str = DETECT_CACHE_PATH,
+        rescan: bool = False,
+        bus_hz: int = DEFAULT_I2C_BUS_HZ,
+    ):
+        if bus is None:
+            if SMBus is None:
+                raise OSError("smbus2 is not installed and no bus backend was given")
+            bus = SMBus(bus_num)
+        self.bus = bus
+        self.bus_hz = bus_hz
+
+        # Set by MotionController while a job runs: progress_hook(done, total)
+        # in coil writes (burst: steps), called at the start and end of
+        # every move and every PROGRESS_EVERY writes in between
+        self.progress_hook = None
+        self.ports = MCP23017Bus(self.bus)
 
         # 1) Detect expanders
-        self._detect_expanders()
+        self.detect_cache_path = detect_cache_path
+        self._detect_expanders(rescan=rescan)
 
-        # 2) Filter available motors
-        self.motor_map = {
-            mid: cfg for mid, cfg in MOTOR_MAP_TEMPLATE.items()
-            if cfg["addr"] in self.detected_addrs
-        }
+        # 2) Generate the motor map for the boards that are present
+        self.motor_map = build_motor_map(self.detected_addrs, wiring)
 
-        # 3) Initialize call counters
+        # 3) Initialize call counters and timing stats
         self.call_counts = {mid: 0 for mid in self.motor_map}
+        self.last_move_stats = None
+        self.move_stats = {}
+
+        # 4) Resume carousel positions from the journal (None = unknown)
+        self.journal = PositionJournal(journal_path, self.motor_map) if journal_path else None
+        self._load_positions()
 
-        # 4) Initialize expanders
+        # 5) Initialize expanders (also seeds the OLAT shadow)
         self._init_expanders()
 
         print(f"[MotorArray] Detected expanders: {self.detected_addrs}")
@@ -84,39 +253,106 @@ class MotorArray:
     # -------------------------------------------------------------
     # Expander detection
     # -------------------------------------------------------------
-    def _detect_expanders(self):
-        self.detected_addrs = []
-        for addr in [ADDR_BOARD1, ADDR_BOARD2]:
-            try:
-                self.bus.write_byte(addr, 0x00)  # probe
-                self.detected_addrs.append(addr)
-            except:
-                pass
+    def _detect_expanders(self, rescan: bool = False):
+        cached = None if rescan else self._load_detect_cache()
+
+        if cached:
+            if all(self.ports.probe(addr) for addr in cached):
+                self.detected_addrs = cached
+                return
+            print("[MotorArray] Cached expander(s) missing; re-probing 0x20–0x27")
+
+        self.detected_addrs = [addr for addr in EXPANDER_ADDRS if self.ports.probe(addr)]
+        self._save_detect_cache()
+
+    def _load_detect_cache(self):
+        if not self.detect_cache_path:
+            return None
+        try:
+            with open(self.detect_cache_path, "r") as f:
+                addrs = json.load(f)["addrs"]
+            return sorted(int(a) for a in addrs if int(a) in EXPANDER_ADDRS)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print(f"[MotorArray] Ignoring bad expander cache: {e}")
+            return None
+
+    def _save_detect_cache(self):
+        if not self.detect_cache_path:
+            return
+        try:
+            directory = os.path.dirname(self.detect_cache_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.detect_cache_path, "w") as f:
+                json.dump({"addrs": self.detected_addrs, "probed_at": time.time()}, f)
+        except OSError as e:
+            print(f"[MotorArray] Could not write expander cache: {e}")
+
+    # -------------------------------------------------------------
+    # Position journal
+    # -------------------------------------------------------------
+    def _load_positions(self):
+        self.phases = {mid: 0 for mid in self.motor_map}
+        self.positions = {mid: None for mid in self.motor_map}
+        if self.journal is None:
+            return
+
+        entries = self.journal.load()
+        for mid in self.motor_map:
+            entry = entries.get(mid)
+            if not entry:
+                continue
+            self.phases[mid] = int(entry.get("phase", 0)) % len(SEQ)
+            if entry.get("state") != "idle":
+                print(f"[MotorArray] Motor {mid} position unknown (interrupted move); homing required")
+            elif entry.get("position") is not None:
+                self.positions[mid] = int(entry["position"]) % HALFSTEPS_PER_REV
 
     # -------------------------------------------------------------
     # Expander setup
     # -------------------------------------------------------------
     def _init_expanders(self):
         for addr in self.detected_addrs:
-            self.bus.write_byte_data(addr, IODIRA, 0x00)
-            self.bus.write_byte_data(addr, IODIRB, 0x00)
-            self.bus.write_byte_data(addr, OLATA, 0x00)
-            self.bus.write_byte_data(addr, OLATB, 0x00)
+            self.ports.init_expander(addr)
 
     # -------------------------------------------------------------
     # Low-level helpers
     # -------------------------------------------------------------
-    def _write_port(self, addr, port, value):
-        reg = OLATA if port == "A" else OLATB
-        self.bus.write_byte_data(addr, reg, value & 0xFF)
+    def write_frame(self, patterns):
+        """
+        Write coil patterns for several motors at once.
+
+        `patterns` maps motor_id → 4-bit pattern. Nibbles that share a
+        port are merged with the shadow register so the port is written
+        once and other motors on it keep their current coils. Both
+        ports of an expander go out in a single bus transaction.
+        """
+        self._write_latch_bytes({
+            motor_id: (pattern & 0x0F) << self.motor_map[motor_id]["shift"]
+            for motor_id, pattern in patterns.items()
+        })
+
+    def _write_latch_bytes(self, values):
+        """write_frame() with nibbles already shifted into place."""
+        merged = {}
+        for motor_id, byte in values.items():
+            cfg = self.motor_map[motor_id]
+            addr = cfg["addr"]
+            if addr not in merged:
+                merged[addr] = {"A": None, "B": None}
+
+            value = merged[addr][cfg["port"]]
+            if value is None:
+                value = self.ports.olat(addr, cfg["port"])
+            merged[addr][cfg["port"]] = (value & ~(0x0F << cfg["shift"])) | byte
+
+        for addr, latches in merged.items():
+            self.ports.write_olat(addr, a=latches["A"], b=latches["B"])
 
     def _write_coils_motor(self, motor_id, pattern):
-        cfg = self.motor_map[motor_id]
-        addr = cfg["addr"]
-        port = cfg["port"]
-        shift = cfg["shift"]
-        nibble_val = (pattern & 0x0F) << shift
-        self._write_port(addr, port, nibble_val)
+        self.write_frame({motor_id: pattern})
 
     def _coils_off_motor(self, motor_id):
         self._write_coils_motor(motor_id, 0x0)
@@ -134,6 +370,42 @@ class MotorArray:
         for mid in self.call_counts:
             self.call_counts[mid] = 0
 
+    def estimate_duration(
+        self,
+        whole_steps: int = WHOLESTEPS_PER_CALL,
+        delay: float = 0.003,
+        profile=None,
+        drive_mode=None,
+    ) -> float:
+        """Expected move time in seconds for a step_motor() call."""
+        return estimate_move_duration(whole_steps, delay, profile, drive_mode)
+
+    # -------------------------------------------------------------
+    # Carousel position
+    # -------------------------------------------------------------
+    def position(self, motor_id):
+        """Half-steps from slot 0 (mod one revolution), or None if unknown."""
+        return self.positions[motor_id]
+
+    def set_home(self, motor_id):
+        """Mark the motor as sitting on slot 0 and reset its call counter."""
+        self.positions[motor_id] = 0
+        self.reset_call_count(motor_id)
+        if self.journal is not None:
+            self.journal.record([motor_id], self.phases, self.positions, "idle")
+
+    def position_info(self) -> dict:
+        info = {}
+        for mid in self.motor_map:
+            pos = self.positions[mid]
+            info[mid] = {
+                "known": pos is not None,
+                "position": pos,
+                "slot": None if pos is None else pos // HALFSTEPS_PER_SLOT,
+                "phase": self.phases[mid],
+            }
+        return info
+
     # -------------------------------------------------------------
     # STEPPER MOVEMENT (PATCHED FOR REVERSED DIRECTION)
     # -------------------------------------------------------------
@@ -144,49 +416,315 @@ class MotorArray:
         whole_steps: int = WHOLESTEPS_PER_CALL,
         delay: float = 0.003,
         enforce_limits: bool = False,   # PATCH: disable max call limits
+        profile=None,
+        half_steps: int = None,
+        drive_mode=None,
+        burst: bool = False,
     ):
-        if motor_id not in self.motor_map:
-            raise ValueError(f"Motor {motor_id} not available on detected hardware")
-
-        if enforce_limits and self.call_counts[motor_id] >= MAX_CALLS_PER_MOTOR:
-            raise MotorLimitReached(
-                f"Motor {motor_id} has reached max {MAX_CALLS_PER_MOTOR} calls."
-            )
+        self.step_motors(
+            motor_ids=[motor_id],
+            direction=direction,
+            whole_steps=whole_steps,
+            delay=delay,
+            enforce_limits=enforce_limits,
+            profile=profile,
+            half_steps=half_steps,
+            drive_mode=drive_mode,
+            burst=burst,
+        )
+
+    def step_motors(
+        self,
+        motor_ids,
+        direction: int = 1,
+        whole_steps: int = WHOLESTEPS_PER_CALL,
+        delay: float = 0.003,
+        enforce_limits: bool = False,
+        profile=None,
+        half_steps: int = None,
+        drive_mode=None,
+        burst: bool = False,
+    ):
+        """
+        Step several motors together in one timebase.
+
+        Every half-step is written as a single frame, so motors on the
+        same port (e.g. 1 + 2 on GPA) cost one write per half-step and
+        a multi-motor dose takes one rotation time instead of several.
+
+        `profile` selects a named MotionProfile (see motion_profiles.py);
+        without one every half-step dwells for a constant `delay`.
+        `half_steps`, if given, overrides `whole_steps`.
+        `drive_mode` is "half" (default), "full" or "wave".
+        `burst` streams the move over I2C instead of timing it in Python
+        (all motors must then share one expander port).
+        """
+        motor_ids = list(dict.fromkeys(motor_ids))
+
+        for motor_id in motor_ids:
+            if motor_id not in self.motor_map:
+                raise ValueError(f"Motor {motor_id} not available on detected hardware")
+
+            if enforce_limits and self.call_counts[motor_id] >= MAX_CALLS_PER_MOTOR:
+                raise MotorLimitReached(
+                    f"Motor {motor_id} has reached max {MAX_CALLS_PER_MOTOR} calls."
+                )
+
+        if half_steps is None:
+            half_steps = whole_steps * HALFSTEPS_PER_WHOLESTEP
+
+        run = self._run_burst if burst else self._run_moves
+        run(
+            {mid: (direction, half_steps) for mid in motor_ids},
+            delay=delay,
+            profile=profile,
+            drive_mode=drive_mode,
+        )
 
-        total_halfsteps = whole_steps * HALFSTEPS_PER_WHOLESTEP
+        if enforce_limits:
+            for motor_id in motor_ids:
+                self.call_counts[motor_id] += 1
+
+    def move_motors(self, moves, delay: float = 0.003, profile=None, drive_mode=None,
+                    burst: bool = False):
+        """
+        Run independent moves in one timebase.
+
+        `moves` maps motor_id → (direction, half_steps). Used e.g. for
+        parallel homing, where every motor has its own distance back to
+        slot 0, and for batch dispenses. Call limits are not enforced.
+        """
+        for motor_id in moves:
+            if motor_id not in self.motor_map:
+                raise ValueError(f"Motor {motor_id} not available on detected hardware")
+
+        run = self._run_burst if burst else self._run_moves
+        run(moves, delay=delay, profile=profile, drive_mode=drive_mode)
+
+    def _run_moves(self, moves, delay: float = 0.003, profile=None, drive_mode=None):
+        """
+        Core stepping loop.
+
+        `moves` maps motor_id → (direction, half_steps). All motors start
+        together and each follows the profile for its own length
+        (move_timeline()), so a shorter move decelerates and is
+        de-energized as soon as it is done while the others carry on.
+        Each motor continues from its journaled phase so no step is lost
+        between moves.
+
+        Half-step counts are angle; the drive mode decides how many
+        half-steps each coil write advances (1, or 2 for full/wave).
+        Delays and profiles apply per write.
+        """
+        profile = get_profile(profile)
+        mode = get_drive_mode(drive_mode)
+        motor_ids = list(moves)
+        timeline = move_timeline(
+            {mid: mode.writes_needed(self.phases[mid], n) for mid, (_, n) in moves.items()},
+            delay, profile,
+        )
 
         # --------------------------------------------------------
         # PATCH: Reverse direction globally
+        # (direction >= 0 walks SEQ backwards)
         # --------------------------------------------------------
-        if direction >= 0:
-            idx = len(SEQ) - 1
-            step_fn = lambda i: (i - 1) % len(SEQ)
-        else:
-            idx = 0
-            step_fn = lambda i: (i + 1) % len(SEQ)
+        seq_step = {mid: (-1 if d >= 0 else 1) for mid, (d, _) in moves.items()}
+        pos_step = {mid: (1 if d >= 0 else -1) for mid, (d, _) in moves.items()}
+        remaining_steps = {mid: n for mid, (_, n) in moves.items()}
+        byte_table = {mid: SEQ_BYTES[self.motor_map[mid]["shift"]] for mid in motor_ids}
+        nseq = len(SEQ)
+
+        if self.journal is not None:
+            self.journal.record(motor_ids, self.phases, self.positions, "moving")
+
+        # The last entry only de-energizes what is left: the finally below
+        # does that after waiting out the final dwell
+        total_writes = max(0, len(timeline) - 1)
+
+        stats = StepTimingStats(motor_ids)
+        stats.nominal_ns = timeline[-1][0] if timeline else 0
+        progress = self.progress_hook
+        written = 0
+        if progress is not None:
+            progress(0, total_writes)
+        start = time.monotonic_ns()
 
         try:
-            for _ in range(total_halfsteps):
-                pattern = SEQ[idx]
-                self._write_coils_motor(motor_id, pattern)
-                time.sleep(delay)
-                idx = step_fn(idx)
+            for t_ns, due in timeline:
+                deadline = start + t_ns
+                remaining = deadline - time.monotonic_ns()
+                if remaining > 0:
+                    time.sleep(remaining / 1e9)
+                elif remaining < 0:
+                    stats.overruns += 1
+                    if -remaining > MAX_CATCHUP_NS:
+                        stats.resyncs += 1
+                        start -= remaining
+                        deadline -= remaining
+                if written == total_writes:
+                    break
+
+                frame = {}
+                for mid in due:
+                    if remaining_steps[mid] > 0:
+                        adv = mode.advance(self.phases[mid], remaining_steps[mid])
+                        self.phases[mid] = (self.phases[mid] + seq_step[mid] * adv) % nseq
+                        frame[mid] = byte_table[mid][self.phases[mid]]
+                        remaining_steps[mid] -= adv
+                        if self.positions[mid] is not None:
+                            self.positions[mid] = (self.positions[mid] + pos_step[mid] * adv) % HALFSTEPS_PER_REV
+                    elif remaining_steps[mid] == 0:
+                        frame[mid] = 0x0
+                        remaining_steps[mid] = -1
+
+                self._write_latch_bytes(frame)
+                stats.record_write(time.monotonic_ns(), deadline)
+
+                written += 1
+                if progress is not None and not written % PROGRESS_EVERY:
+                    progress(written, total_writes)
+
+            if progress is not None:
+                progress(total_writes, total_writes)
 
         finally:
-            self._coils_off_motor(motor_id)
+            self.write_frame({mid: 0x0 for mid in motor_ids})
+            if self.journal is not None:
+                self.journal.record(motor_ids, self.phases, self.positions, "idle")
+            stats.finish()
+            summary = stats.summary()
+            self.last_move_stats = summary
+            for motor_id in motor_ids:
+                self.move_stats[motor_id] = summary
+
+    def _run_burst(self, moves, delay: float = 0.003, profile=None, drive_mode=None):
+        """
+        Burst variant of _run_moves().
+
+        The move_timeline() of the move is expanded up front into one
+        latch value per [OLATA, OLATB] pair slot (each frame repeated
+        for its share of the timeline, bus_hz / 18 slots per second) and
+        streamed with MCP23017Bus.burst(). Phases and positions are
+        updated per chunk, so an aborted burst still journals where the
+        motors really stopped.
+        """
+        profile = get_profile(profile)
+        mode = get_drive_mode(drive_mode)
+        motor_ids = list(moves)
+
+        ports = {(self.motor_map[mid]["addr"], self.motor_map[mid]["port"]) for mid in motor_ids}
+        if len(ports) != 1:
+            raise ValueError("Burst mode needs all motors on the same expander port")
+        addr, port = ports.pop()
+
+        timeline = move_timeline(
+            {mid: mode.writes_needed(self.phases[mid], n) for mid, (_, n) in moves.items()},
+            delay, profile,
+        )
+
+        # Latch bits of the other motor(s) on this port are left as they are
+        base = self.ports.olat(addr, port)
+        for mid in motor_ids:
+            base &= ~(0x0F << self.motor_map[mid]["shift"])
+
+        # PATCH: Reverse direction globally (direction >= 0 walks SEQ backwards)
+        seq_step = {mid: (-1 if d >= 0 else 1) for mid, (d, _) in moves.items()}
+        pos_step = {mid: (1 if d >= 0 else -1) for mid, (d, _) in moves.items()}
+        remaining_steps = {mid: n for mid, (_, n) in moves.items()}
+        byte_table = {mid: SEQ_BYTES[self.motor_map[mid]["shift"]] for mid in motor_ids}
+        nseq = len(SEQ)
+
+        phases = {mid: self.phases[mid] for mid in motor_ids}
+        positions = {mid: self.positions[mid] for mid in motor_ids}
+        nibbles = {mid: 0x0 for mid in motor_ids}
+
+        data = bytearray()
+        step_end = []      # byte offset just past each frame
+        step_state = []    # (phases, positions) after each frame
+        pair_bits = I2C_BITS_PER_BYTE * BURST_BYTES_PER_VALUE
+        slot_ns = pair_bits * 1e9 / self.bus_hz
+
+        # The last timeline entry only de-energizes: the finally below does that
+        for (t_ns, due), (t_next, _) in zip(timeline, timeline[1:]):
+            for mid in due:
+                if remaining_steps[mid] > 0:
+                    adv = mode.advance(phases[mid], remaining_steps[mid])
+                    phases[mid] = (phases[mid] + seq_step[mid] * adv) % nseq
+                    remaining_steps[mid] -= adv
+                    if positions[mid] is not None:
+                        positions[mid] = (positions[mid] + pos_step[mid] * adv) % HALFSTEPS_PER_REV
+                    nibbles[mid] = byte_table[mid][phases[mid]]
+                else:
+                    nibbles[mid] = 0x0
+
+            value = base
+            for nibble in nibbles.values():
+                value |= nibble
+
+            # Slot boundaries from absolute times, so rounding never drifts
+            repeat_count = max(1, round(t_next / slot_ns) - round(t_ns / slot_ns))
+            data.extend(bytes([value]) * repeat_count)
+            step_end.append(len(data))
+            step_state.append((dict(phases), dict(positions)))
+        nominal_ns = int(len(data) * slot_ns)
+
+        if self.journal is not None:
+            self.journal.record(motor_ids, self.phases, self.positions, "moving")
+
+        stats = StepTimingStats(motor_ids)
+        stats.nominal_ns = nominal_ns
+        progress = self.progress_hook
+        if progress is not None:
+            progress(0, len(step_end))
+
+        def on_chunk(sent):
+            stats.record_write(time.monotonic_ns())
+            done = bisect_right(step_end, sent)
+            if done:
+                phases_done, positions_done = step_state[done - 1]
+                self.phases.update(phases_done)
+                self.positions.update(positions_done)
+            if progress is not None:
+                progress(done, len(step_end))
 
-        if enforce_limits:
-            self.call_counts[motor_id] += 1
+        try:
+            stats.record_write(time.monotonic_ns())
+            self.ports.burst(addr, port, data, on_chunk=on_chunk)
+
+        finally:
+            self.write_frame({mid: 0x0 for mid in motor_ids})
+            if self.journal is not None:
+                self.journal.record(motor_ids, self.phases, self.positions, "idle")
+            stats.finish()
+            # Intervals are per I2C chunk; report steps/nominal per step
+            summary = stats.summary()
+            summary["burst"] = True
+            summary["burst_bytes"] = len(data) * BURST_BYTES_PER_VALUE
+            summary["burst_chunks"] = len(stats.intervals_ns)
+            summary["steps"] = len(step_end)
+            summary["nominal_interval_ms"] = (nominal_ns / len(step_end) / 1e6) if step_end else None
+            self.last_move_stats = summary
+            for motor_id in motor_ids:
+                self.move_stats[motor_id] = summary
 
     # -------------------------------------------------------------
     def coils_off_all(self):
         for addr in self.detected_addrs:
-            self.bus.write_byte_data(addr, OLATA, 0x00)
-            self.bus.write_byte_data(addr, OLATB, 0x00)
+            self.ports.write_olat(addr, a=0x00, b=0x00)
+
+    def bus_stats(self) -> dict:
+        return self.ports.stats()
+
+    def timing_stats(self) -> dict:
+        """Step timing of the most recent move, overall and per motor."""
+        return {
+            "last_move": self.last_move_stats,
+            "motors": dict(self.move_stats),
+        }
 
     def close(self):
         self.coils_off_all()
-        self.bus.close()
+        self.ports.close()
 
 
 if __name__ == "__main__":
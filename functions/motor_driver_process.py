@@ -0,0 +1,518 @@
+#!/usr/bin/env python3
+"""
+Dedicated motor-driver process for PillSyncOS.
+
+Step timing suffers when the stepping loop shares an interpreter (and
+its GIL) with Flask, the medication scheduler and the alarm loops. This
+module lets a separate process own the I2C bus instead:
+
+    python3 -m functions.motor_driver_process            # from the repo root
+    sudo python3 -m functions.motor_driver_process --cpu 3
+
+The driver tries to run as SCHED_FIFO (falling back to a negative nice
+value), can pin itself to one CPU, and serves one command at a time on
+a Unix socket in /run/pillsync, 0o660 for MOTOR_DRIVER_SOCKET_GROUP, so
+the web app's user can connect even when the driver runs as root. The
+protocol is one JSON object per line:
+
+    → {"id": 7, "method": "step_motor", "kwargs": {"motor_id": 1}}
+    ← {"id": 7, "ok": true, "result": null, "state": {...}}
+
+Every reply carries a "state" snapshot (positions, timing of the last
+move, I2C stats), so status queries from the web side never have to
+wait for a move in progress.
+
+MotorDriverClient is a drop-in stand-in for MotorArray on the
+CoreController side (step_motor / step_motors / move_motors /
+position_info / ...). connect_motor_driver() connects to a running
+driver, optionally spawns one, and returns None when neither works so
+core.py can fall back to driving the motors in-process. If the driver
+goes away later, the call in flight fails with OSError (a move is
+never retried blindly) and the next call reconnects.
+"""
+
+import argparse
+import gc
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+from functions.unix_socket import bind_group_socket
+from functions.motor_array import (
+    MotorArray,
+    MotorLimitReached,
+    FULL_WIRING,
+    estimate_move_duration,
+)
+from config import (
+    MOTOR_BACKEND,
+    SIM_EXPANDER_ADDRS,
+    SIM_I2C_LATENCY,
+    MOTORS_PER_EXPANDER,
+    RESCAN_EXPANDERS,
+    I2C_BUS_HZ,
+    MOTOR_DRIVER_SOCKET,
+    MOTOR_DRIVER_SOCKET_GROUP,
+    MOTOR_DRIVER_RT_PRIORITY,
+    MOTOR_DRIVER_CPU,
+)
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# How long connect_motor_driver() waits for a freshly spawned driver
+SPAWN_TIMEOUT = 10.0
+
+# Exceptions re-raised on the client side by name
+_ERRORS = {
+    "MotorLimitReached": MotorLimitReached,
+    "ValueError": ValueError,
+    "KeyError": KeyError,
+    "OSError": OSError,
+}
+
+
+# -------------------------------------------------------------
+# Setup shared with core.py
+# -------------------------------------------------------------
+def build_motor_array() -> MotorArray:
+    """MotorArray on the configured backend (real SMBus or simulator)."""
+    bus = None
+    if MOTOR_BACKEND == "sim":
+        from functions.sim.mcp23017_sim import SimSMBus
+        print("[MotorDriver] Using simulated MCP23017 bus backend")
+        bus = SimSMBus(addrs=SIM_EXPANDER_ADDRS, latency=SIM_I2C_LATENCY)
+
+    return MotorArray(
+        bus=bus,
+        wiring=FULL_WIRING[:MOTORS_PER_EXPANDER],
+        rescan=RESCAN_EXPANDERS,
+        bus_hz=I2C_BUS_HZ,
+    )
+
+
+def raise_priority(rt_priority: int = MOTOR_DRIVER_RT_PRIORITY, cpu=None) -> dict:
+    """
+    Best-effort real-time scheduling for the current process.
+
+    SCHED_FIFO needs root or CAP_SYS_NICE; without it we settle for
+    nice -10 (or whatever is allowed). Returns what was applied.
+    """
+    info = {"policy": "other", "rt_priority": None, "nice": None, "cpu": None}
+
+    if cpu is not None:
+        try:
+            os.sched_setaffinity(0, {cpu})
+            info["cpu"] = cpu
+        except (AttributeError, OSError) as e:
+            print(f"[MotorDriver] Could not pin to CPU {cpu}: {e}")
+
+    try:
+        os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(rt_priority))
+        info["policy"] = "fifo"
+        info["rt_priority"] = rt_priority
+    except (AttributeError, OSError) as e:
+        print(f"[MotorDriver] SCHED_FIFO unavailable ({e}); using nice instead")
+        try:
+            info["nice"] = os.nice(-10)
+        except OSError:
+            info["nice"] = os.nice(0)
+
+    return info
+
+
+# -------------------------------------------------------------
+# Driver (server) side
+# -------------------------------------------------------------
+class MotorDriverServer:
+    def __init__(self, motor_array: MotorArray, socket_path: str = MOTOR_DRIVER_SOCKET,
+                 socket_group: str = MOTOR_DRIVER_SOCKET_GROUP):
+        self.motor_array = motor_array
+        self.socket_path = socket_path
+        self.socket_group = socket_group
+        self.sched_info = {}
+        self._running = False
+
+        self._handlers = {
+            "hello": self._hello,
+            "step_motor": motor_array.step_motor,
+            "step_motors": motor_array.step_motors,
+            "move_motors": self._move_motors,
+            "set_home": motor_array.set_home,
+            "estimate_duration": motor_array.estimate_duration,
+            "coils_off_all": motor_array.coils_off_all,
+            "state": lambda: None,
+            "shutdown": self._shutdown,
+        }
+
+    def _hello(self):
+        ma = self.motor_array
+        return {
+            "pid": os.getpid(),
+            "sched": self.sched_info,
+            "detected_addrs": ma.detected_addrs,
+            "motor_map": [[mid, info] for mid, info in ma.motor_map.items()],
+        }
+
+    def _move_motors(self, moves, **kwargs):
+        # JSON has no int keys: moves arrive as [[motor_id, direction, half_steps], ...]
+        return self.motor_array.move_motors(
+            {mid: (direction, n) for mid, direction, n in moves}, **kwargs
+        )
+
+    def _shutdown(self):
+        self._running = False
+
+    def _state(self) -> dict:
+        ma = self.motor_array
+        state = {
+            "positions": [[mid, pos] for mid, pos in ma.positions.items()],
+            "position_info": [[mid, info] for mid, info in ma.position_info().items()],
+            "last_move": ma.last_move_stats,
+            "move_stats": [[mid, s] for mid, s in ma.move_stats.items()],
+            "bus": ma.bus_stats(),
+        }
+        if hasattr(ma.bus, "stats"):
+            state["sim_bus"] = ma.bus.stats()
+        return state
+
+    def handle(self, request) -> dict:
+        reply = {"id": request.get("id") if isinstance(request, dict) else None}
+
+        started = time.monotonic_ns()
+        try:
+            if not isinstance(request, dict):
+                raise ValueError("Request must be a JSON object")
+            method = request.get("method")
+            handler = self._handlers.get(method) if isinstance(method, str) else None
+            if handler is None:
+                raise ValueError(f"Unknown method {method!r}")
+            reply["result"] = handler(*request.get("args", []), **request.get("kwargs", {}))
+            reply["ok"] = True
+        except Exception as e:
+            reply["ok"] = False
+            reply["error"] = type(e).__name__
+            reply["message"] = str(e)
+
+        reply["elapsed_s"] = (time.monotonic_ns() - started) / 1e9
+        reply["state"] = self._state()
+        return reply
+
+    def _serve_connection(self, conn):
+        with conn, conn.makefile("rwb") as stream:
+            for line in stream:
+                if not line.strip():
+                    continue
+                try:
+                    request = json.loads(line)
+                except ValueError as e:
+                    request = {"method": None}
+                    print(f"[MotorDriver] Bad request: {e}")
+                reply = self.handle(request)
+                stream.write(json.dumps(reply).encode() + b"\n")
+                stream.flush()
+                if not self._running:
+                    return
+
+    def serve_forever(self):
+        """Accept one client at a time; moves are strictly serial anyway."""
+        server = bind_group_socket(self.socket_path, self.socket_group, "[MotorDriver]")
+        server.listen(1)
+        self._running = True
+        print(f"[MotorDriver] Listening on {self.socket_path}")
+
+        try:
+            while self._running:
+                conn, _ = server.accept()
+                try:
+                    self._serve_connection(conn)
+                except OSError as e:
+                    print(f"[MotorDriver] Client connection dropped: {e}")
+                    self.motor_array.coils_off_all()
+                except Exception as e:
+                    # e.g. a reply that can't be encoded: drop the client, keep serving
+                    print(f"[MotorDriver] Client connection failed: {e!r}")
+                    self.motor_array.coils_off_all()
+        finally:
+            server.close()
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+
+
+# -------------------------------------------------------------
+# CoreController (client) side
+# -------------------------------------------------------------
+class MotorDriverClient:
+    """
+    MotorArray look-alike that forwards moves to the driver process.
+
+    Moves block the calling thread (the MotionController) until the
+    driver replies. Position / timing queries and estimate_duration()
+    are answered locally (state snapshot of the latest reply) and never
+    touch the socket, so they do not wait behind a running move.
+    progress_hook is called once per move, when its reply arrives.
+
+    A lost connection fails the call in flight with OSError – a move is
+    not resent, since the driver may have run part of it – and the next
+    call reconnects (to a driver restarted by systemd, say).
+    """
+
+    def __init__(self, socket_path: str = MOTOR_DRIVER_SOCKET, proc=None, timeout=None):
+        self.socket_path = socket_path
+        self.proc = proc        # set when we spawned the driver ourselves
+        self.bus = None         # no local bus; see bus_stats()
+        self._lock = threading.Lock()
+        self._ids = 0
+        self._state = {}
+        self.progress_hook = None
+        self.timeout = timeout
+        self.reconnects = 0
+        self._sock = None
+        self._stream = None
+
+        with self._lock:
+            self._connect()
+
+    def _connect(self):
+        """Open the socket and say hello (caller holds _lock)."""
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.settimeout(self.timeout)
+            sock.connect(self.socket_path)
+        except OSError:
+            sock.close()
+            raise
+        self._sock = sock
+        self._stream = sock.makefile("rwb")
+
+        hello = self._roundtrip("hello")
+        self.driver_pid = hello["pid"]
+        self.sched_info = hello["sched"]
+        self.detected_addrs = hello["detected_addrs"]
+        self.motor_map = {mid: info for mid, info in hello["motor_map"]}
+        print(f"[MotorDriver] Connected to driver pid {self.driver_pid} ({self.sched_info.get('policy')})")
+
+    def _disconnect(self):
+        if self._stream is not None:
+            try:
+                self._stream.close()
+            except OSError:
+                pass
+        if self._sock is not None:
+            self._sock.close()
+        self._stream = None
+        self._sock = None
+
+    def _driver_gone(self) -> str:
+        if self.proc is not None and self.proc.poll() is not None:
+            return f" (driver pid {self.proc.pid} exited with {self.proc.returncode})"
+        return ""
+
+    def _roundtrip(self, method, *args, **kwargs):
+        """One request / reply on the open connection (caller holds _lock)."""
+        self._ids += 1
+        request = {"id": self._ids, "method": method, "args": list(args), "kwargs": kwargs}
+        try:
+            self._stream.write(json.dumps(request).encode() + b"\n")
+            self._stream.flush()
+            line = self._stream.readline()
+        except OSError as e:
+            self._disconnect()
+            raise OSError(f"Motor driver connection lost during {method}: {e}{self._driver_gone()}")
+
+        if not line:
+            self._disconnect()
+            raise OSError(f"Motor driver process closed the connection during {method}"
+                          f"{self._driver_gone()}")
+
+        reply = json.loads(line)
+        self._state = reply.get("state") or self._state
+        if not reply["ok"]:
+            raise _ERRORS.get(reply["error"], RuntimeError)(reply["message"])
+        return reply["result"]
+
+    def _call(self, method, *args, **kwargs):
+        with self._lock:
+            if self._stream is None:
+                try:
+                    self._connect()
+                except OSError as e:
+                    self._disconnect()
+                    raise OSError(f"Motor driver not reachable at {self.socket_path}: {e}"
+                                  f"{self._driver_gone()}")
+                self.reconnects += 1
+            return self._roundtrip(method, *args, **kwargs)
+
+    def _move(self, method, *args, **kwargs):
+        self._call(method, *args, **kwargs)
+        # Progress arrives in one piece: the driver has no channel back mid-move
+        progress = self.progress_hook
+        if progress is not None:
+            steps = (self.last_move_stats or {}).get("steps") or 0
+            progress(0, steps)
+            progress(steps, steps)
+
+    @staticmethod
+    def _name(value):
+        """Profiles / drive modes travel by name."""
+        return getattr(value, "name", value)
+
+    # -------------------------------------------------------------
+    # Moves (forwarded)
+    # -------------------------------------------------------------
+    def step_motor(self, motor_id, direction=1, whole_steps=None, delay=0.003,
+                   enforce_limits=False, profile=None, half_steps=None,
+                   drive_mode=None, burst=False):
+        kwargs = dict(
+            motor_id=motor_id, direction=direction, delay=delay,
+            enforce_limits=enforce_limits, profile=self._name(profile),
+            half_steps=half_steps, drive_mode=self._name(drive_mode), burst=burst,
+        )
+        if whole_steps is not None:
+            kwargs["whole_steps"] = whole_steps
+        self._move("step_motor", **kwargs)
+
+    def step_motors(self, motor_ids, direction=1, whole_steps=None, delay=0.003,
+                    enforce_limits=False, profile=None, half_steps=None,
+                    drive_mode=None, burst=False):
+        kwargs = dict(
+            motor_ids=list(motor_ids), direction=direction, delay=delay,
+            enforce_limits=enforce_limits, profile=self._name(profile),
+            half_steps=half_steps, drive_mode=self._name(drive_mode), burst=burst,
+        )
+        if whole_steps is not None:
+            kwargs["whole_steps"] = whole_steps
+        self._move("step_motors", **kwargs)
+
+    def move_motors(self, moves, delay=0.003, profile=None, drive_mode=None, burst=False):
+        self._move(
+            "move_motors",
+            [[mid, direction, n] for mid, (direction, n) in moves.items()],
+            delay=delay, profile=self._name(profile), drive_mode=self._name(drive_mode),
+            burst=burst,
+        )
+
+    def set_home(self, motor_id):
+        self._call("set_home", motor_id)
+
+    def coils_off_all(self):
+        self._call("coils_off_all")
+
+    def estimate_duration(self, **kwargs) -> float:
+        # Pure calculation: no round-trip, so it never waits for a running move
+        return estimate_move_duration(**kwargs)
+
+    # -------------------------------------------------------------
+    # Status (from the last reply's snapshot)
+    # -------------------------------------------------------------
+    @property
+    def positions(self) -> dict:
+        return {mid: pos for mid, pos in self._state.get("positions", [])}
+
+    def position(self, motor_id):
+        return self.positions[motor_id]
+
+    def position_info(self) -> dict:
+        return {mid: info for mid, info in self._state.get("position_info", [])}
+
+    @property
+    def last_move_stats(self):
+        return self._state.get("last_move")
+
+    def timing_stats(self) -> dict:
+        return {
+            "last_move": self._state.get("last_move"),
+            "motors": {mid: s for mid, s in self._state.get("move_stats", [])},
+            "driver": {"pid": self.driver_pid, "sched": self.sched_info},
+        }
+
+    def bus_stats(self) -> dict:
+        stats = dict(self._state.get("bus") or {})
+        if "sim_bus" in self._state:
+            stats["sim_bus"] = self._state["sim_bus"]
+        return stats
+
+    def close(self):
+        """Coils off; stop the driver too if we started it."""
+        try:
+            self.coils_off_all()
+            if self.proc is not None:
+                self._call("shutdown")
+                self.proc.wait(timeout=5.0)
+        except (OSError, subprocess.TimeoutExpired) as e:
+            print(f"[MotorDriver] Error closing driver: {e}")
+        finally:
+            with self._lock:
+                self._disconnect()
+
+
+def connect_motor_driver(socket_path: str = MOTOR_DRIVER_SOCKET, spawn: bool = True):
+    """
+    MotorDriverClient for a running driver, spawning one if allowed.
+
+    Returns None if no driver can be reached, so the caller can drive
+    the motors in-process instead.
+    """
+    try:
+        return MotorDriverClient(socket_path)
+    except OSError:
+        if not spawn:
+            return None
+
+    print("[MotorDriver] No driver running; starting one")
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "functions.motor_driver_process", "--socket", socket_path],
+        cwd=REPO_ROOT,
+    )
+
+    deadline = time.monotonic() + SPAWN_TIMEOUT
+    while time.monotonic() < deadline and proc.poll() is None:
+        try:
+            return MotorDriverClient(socket_path, proc=proc)
+        except OSError:
+            time.sleep(0.1)
+
+    print("[MotorDriver] Driver process did not come up")
+    if proc.poll() is None:
+        proc.terminate()
+    return None
+
+
+# -------------------------------------------------------------
+# Entry point
+# -------------------------------------------------------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="PillSync motor driver process")
+    parser.add_argument("--socket", default=MOTOR_DRIVER_SOCKET)
+    parser.add_argument("--group", default=MOTOR_DRIVER_SOCKET_GROUP,
+                        help="group allowed to connect (socket mode 0o660)")
+    parser.add_argument("--priority", type=int, default=MOTOR_DRIVER_RT_PRIORITY,
+                        help="SCHED_FIFO priority (1–99)")
+    parser.add_argument("--cpu", type=int, default=MOTOR_DRIVER_CPU,
+                        help="pin the driver to this CPU")
+    args = parser.parse_args(argv)
+
+    # SIGTERM (systemd stop, parent exit) → normal cleanup below
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+
+    motor_array = build_motor_array()
+    server = MotorDriverServer(motor_array, args.socket, args.group)
+    server.sched_info = raise_priority(args.priority, args.cpu)
+
+    # Keep startup garbage out of the collector's way during moves
+    gc.collect()
+    if hasattr(gc, "freeze"):
+        gc.freeze()
+
+    try:
+        server.serve_forever()
+    finally:
+        motor_array.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -5,67 +5,136 @@ Motor homing utilities for PillSyncOS.
 Homing behavior (software-based):
 - Each motor has 7 dispense positions per full rotation.
 - Each dispense call = 320 whole steps.
-- Homing = rotate 7 × 320 whole steps in a fixed direction,
-  then reset the call counter for that motor.
+- If the motor's position is known from the position journal, homing
+  turns the shortest way back to slot 0 (possibly not at all).
+- Otherwise homing = rotate 7 × 320 whole steps in a fixed direction.
+- Either way the motor is then marked as on slot 0 and its call
+  counter is reset.
+
+home_all_motors() homes every detected motor (4–6 included when board
+0x21 is present). In parallel mode (default) all motors turn in the same
+timebase with merged nibble writes, so homing takes one rotation's time
+no matter how many carousels there are.
 
 PATCHES:
 - Default homing direction changed to +1 (CW),
   because global motor direction in MotorArray was reversed.
-- Home only motors 1–3 (motors 4–6 disabled for demo day).
+- Optional motion profile (see motion_profiles.py) to cruise faster.
+- Optional drive mode (see drive_modes.py); "full" halves the writes.
 """
 
-from .motor_array import WHOLESTEPS_PER_CALL
+from .motor_array import (
+    WHOLESTEPS_PER_CALL,
+    HALFSTEPS_PER_WHOLESTEP,
+    SLOTS_PER_REV,
+    HALFSTEPS_PER_REV,
+)
 
 # 7 × 320 whole steps per full homing move
-SLOTS_PER_REV = 7
 HOME_WHOLESTEPS = SLOTS_PER_REV * WHOLESTEPS_PER_CALL
 
 
+def shortest_path_home(position: int):
+    """
+    (direction, half_steps) that brings a motor at `position`
+    half-steps past slot 0 back to slot 0 by the shorter way round.
+    """
+    forward = (-position) % HALFSTEPS_PER_REV
+    backward = position % HALFSTEPS_PER_REV
+    if forward <= backward:
+        return +1, forward
+    return -1, backward
+
+
 def home_motor(
     motor_array,
     motor_id: int,
     direction: int = +1,   # PATCH: home now moves CW by default
     delay: float = 0.003,
+    profile=None,
+    force_full: bool = False,
+    drive_mode=None,
 ) -> bool:
-    """Home a single motor by rotating it 7 × 320 whole steps."""
+    """
+    Home a single motor.
+
+    Known position → shortest move back to slot 0.
+    Unknown position (or force_full) → full 7 × 320 whole-step rotation
+    in `direction`.
+    """
+    move_direction, half_steps = homing_move(motor_array, motor_id, direction, force_full)
 
     # Ignore per-motor call limits during homing
-    motor_array.step_motor(
-        motor_id=motor_id,
-        direction=direction,
-        whole_steps=HOME_WHOLESTEPS,
-        delay=delay,
-        enforce_limits=False,
-    )
-
-    motor_array.reset_call_count(motor_id)
+    if half_steps:
+        motor_array.step_motor(
+            motor_id=motor_id,
+            direction=move_direction,
+            delay=delay,
+            enforce_limits=False,
+            profile=profile,
+            half_steps=half_steps,
+            drive_mode=drive_mode,
+        )
+
+    motor_array.set_home(motor_id)
     return True
 
 
+def homing_move(motor_array, motor_id: int, direction: int = +1, force_full: bool = False):
+    """(direction, half_steps) needed to bring one motor back to slot 0."""
+    position = motor_array.position(motor_id)
+    if position is None or force_full:
+        return direction, HOME_WHOLESTEPS * HALFSTEPS_PER_WHOLESTEP
+    return shortest_path_home(position)
+
+
 def home_all_motors(
     motor_array,
     direction: int = +1,   # PATCH: default homing direction now CW
     delay: float = 0.003,
+    profile=None,
+    force_full: bool = False,
+    parallel: bool = True,
+    motor_ids=None,
+    drive_mode=None,
 ) -> dict:
     """
-    Home motors 1–3 only.
-    Motors 4–6 are disabled for demo day.
+    Home every detected motor (or just `motor_ids`).
+
+    parallel=True rotates all motors at once; each one stops as soon as
+    it reaches slot 0. parallel=False homes them one after another.
     """
+    if motor_ids is None:
+        motor_ids = sorted(motor_array.motor_map)
+
     results = {}
 
-    for mid in [1, 2, 3]:   # PATCH: demo-safe motor list
-        ok = home_motor(
-            motor_array=motor_array,
-            motor_id=mid,
-            direction=direction,
-            delay=delay,
-        )
-        results[mid] = ok
+    if not parallel:
+        for mid in motor_ids:
+            ok = home_motor(
+                motor_array=motor_array,
+                motor_id=mid,
+                direction=direction,
+                delay=delay,
+                profile=profile,
+                force_full=force_full,
+                drive_mode=drive_mode,
+            )
+            results[mid] = ok
+        return results
+
+    moves = {}
+    for mid in motor_ids:
+        move_direction, half_steps = homing_move(motor_array, mid, direction, force_full)
+        if half_steps:
+            moves[mid] = (move_direction, half_steps)
+
+    if moves:
+        motor_array.move_motors(moves, delay=delay, profile=profile, drive_mode=drive_mode)
 
-    # Optional: mark disabled motors in results
-    # results[4] = "disabled"
-    # results[5] = "disabled"
-    # results[6] = "disabled"
+    for mid in motor_ids:
+        motor_array.set_home(mid)
+        results[mid] = True
 
     return results
 
@@ -3,16 +3,29 @@
 NeoPixel alarm visual driver for PillSyncOS.
 
 This version does NOT talk directly to the hardware.
-It calls the privileged root helper:
+It talks to the privileged helper daemon (functions/neopixel_daemon.py)
+over a Unix socket, sending whole flash patterns that the daemon plays
+with its own timing. If the daemon is not running it falls back to the
+original one-shot root helper:
     /usr/local/bin/neopixel_driver.py
 
 This keeps PillSync running as a normal user
 while still allowing LED control via sudo.
 """
 
+import json
+import socket
+import threading
 import time
 import subprocess
 
+from config import NEOPIXEL_SOCKET, NEOPIXEL_ALERT_COLOR
+
+LEGACY_HELPER = "/usr/local/bin/neopixel_driver.py"
+
+# Don't retry a missing daemon on every flash
+RECONNECT_INTERVAL = 5.0
+
 # How many chirps per group (match piezo)
 CHIRPS_PER_GROUP = 2
 
@@ -22,22 +35,105 @@ CHIRP_OFF = 0.12     # pause between chirps
 GROUP_PAUSE = 0.6    # pause after two chirps
 
 
-def _flash_on():
-    """Trigger root helper to flash NeoPixels ON."""
+class NeoPixelClient:
+    """Line-JSON client for the NeoPixel daemon; send() never raises."""
+
+    def __init__(self, socket_path: str = NEOPIXEL_SOCKET, timeout: float = 0.5):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._sock = None
+        self._stream = None
+        self._next_attempt = 0.0
+
+    def _connect(self):
+        if time.monotonic() < self._next_attempt:
+            return False
+        try:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            sock.connect(self.socket_path)
+        except OSError:
+            self._next_attempt = time.monotonic() + RECONNECT_INTERVAL
+            return False
+        self._sock = sock
+        self._stream = sock.makefile("rwb")
+        return True
+
+    def _close(self):
+        for obj in (self._stream, self._sock):
+            try:
+                if obj is not None:
+                    obj.close()
+            except OSError:
+                pass
+        self._sock = self._stream = None
+
+    def send(self, msg: dict) -> bool:
+        """True if the daemon accepted the command."""
+        with self._lock:
+            if self._sock is None and not self._connect():
+                return False
+            try:
+                self._stream.write(json.dumps(msg).encode() + b"\n")
+                self._stream.flush()
+                reply = json.loads(self._stream.readline() or b"{}")
+            except (OSError, ValueError):
+                self._close()
+                self._next_attempt = time.monotonic() + RECONNECT_INTERVAL
+                return False
+            return bool(reply.get("ok"))
+
+
+_client = NeoPixelClient()
+
+
+def _legacy_helper(arg):
     subprocess.Popen(
-        ["sudo", "/usr/local/bin/neopixel_driver.py", "alert"],
+        ["sudo", LEGACY_HELPER, arg],
         stdout=subprocess.DEVNULL,
         stderr=subprocess.DEVNULL,
     )
 
 
-def _flash_off():
-    """Turn NeoPixels OFF."""
-    subprocess.Popen(
-        ["sudo", "/usr/local/bin/neopixel_driver.py", "off"],
-        stdout=subprocess.DEVNULL,
-        stderr=subprocess.DEVNULL,
-    )
+def flash_on():
+    """Flash NeoPixels ON (daemon, else one-shot root helper)."""
+    if not _client.send({"cmd": "on"}):
+        _legacy_helper("alert")
+
+
+def flash_off():
+    """Turn NeoPixels OFF (also stops a running pattern)."""
+    if not _client.send({"cmd": "off"}):
+        _legacy_helper("off")
+
+
+def alarm_pattern(color=NEOPIXEL_ALERT_COLOR):
+    """One chirp group as daemon sequence steps: [[color, seconds], ...]."""
+    steps = []
+    for _ in range(CHIRPS_PER_GROUP):
+        steps.append([list(color), CHIRP_ON])
+        steps.append([None, CHIRP_OFF])
+    steps.append([None, GROUP_PAUSE])
+    return steps
+
+
+def play_sequence(steps, duration: float = None, repeat: int = None) -> bool:
+    """
+    Hand a whole pattern to the daemon, played with its own timing.
+    Returns False if the daemon is unavailable (caller falls back).
+    """
+    msg = {"cmd": "sequence", "steps": steps}
+    if duration is not None:
+        msg["duration"] = duration
+    if repeat is not None:
+        msg["repeat"] = repeat
+    return _client.send(msg)
+
+
+def play_alarm_pattern(duration: float) -> bool:
+    """The piezo-synced flash pattern for `duration` seconds, via the daemon."""
+    return play_sequence(alarm_pattern(), duration=duration)
 
 
 def alarm_flash(duration: float = 30.0):
@@ -54,14 +150,23 @@ def alarm_flash(duration: float = 30.0):
     print("Starting Neopixel alarm flash (synced to piezo)...")
     start = time.time()
 
+    # Daemon available: send the pattern once and let it keep time
+    if play_alarm_pattern(duration):
+        try:
+            time.sleep(duration)
+        finally:
+            flash_off()
+            print("Neopixel alarm finished.")
+        return
+
     try:
         while (time.time() - start) < duration:
 
             # Two chirps in a row (same as piezo)
             for _ in range(CHIRPS_PER_GROUP):
-                _flash_on()
+                flash_on()
                 time.sleep(CHIRP_ON)
-                _flash_off()
+                flash_off()
                 time.sleep(CHIRP_OFF)
 
             # Group pause (same as piezo)
@@ -69,7 +174,7 @@ def alarm_flash(duration: float = 30.0):
 
     finally:
         # Make sure LEDs turn off at end
-        _flash_off()
+        flash_off()
         print("Neopixel alarm finished.")
 
 
@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+Persistent NeoPixel helper for PillSyncOS.
+
+Replaces one `sudo neopixel_driver.py ...` process per flash with one
+long-lived privileged process. Start it as root (systemd unit, or by
+hand from the repo root):
+
+    sudo python3 -m functions.neopixel_daemon
+    python3 -m functions.neopixel_daemon --sim      # no LEDs, just logs
+
+PillSync (running as a normal user) talks to it over a Unix socket,
+one JSON object per line, one {"ok": ...} reply per line:
+
+    {"cmd": "on"}                              # alert color
+    {"cmd": "color", "color": [255, 80, 0]}    # any color
+    {"cmd": "off"}                             # also stops a sequence
+    {"cmd": "sequence",
+     "steps": [[[255, 80, 0], 0.22], [null, 0.12], ...],
+     "duration": 30.0}                         # or "repeat": n
+    {"cmd": "ping"}
+
+A sequence is a list of [color, seconds] steps (null = off) played by a
+local thread against monotonic deadlines, so a whole flash pattern is
+sent once and keeps its timing no matter how busy the web app is. Any
+new command replaces the running sequence. Steps shorter than
+MIN_STEP_S are rejected, so no client can make the root process
+refresh the strip in a tight loop.
+
+The socket lives in /run/pillsync (not world-writable /tmp) and is
+0o660, owned by NEOPIXEL_SOCKET_GROUP: only members of that group –
+the user PillSync runs as – can talk to the daemon.
+"""
+
+import argparse
+import json
+import os
+import signal
+import sys
+import threading
+import time
+
+from functions.unix_socket import bind_group_socket
+from config import (
+    NEOPIXEL_SOCKET,
+    NEOPIXEL_SOCKET_GROUP,
+    NEOPIXEL_PIN,
+    NEOPIXEL_COUNT,
+    NEOPIXEL_BRIGHTNESS,
+    NEOPIXEL_ALERT_COLOR,
+)
+
+OFF = (0, 0, 0)
+
+# Shortest sequence step (s); faster than this is not a visible flash
+MIN_STEP_S = 0.05
+
+
+class _LogPixels:
+    """Stand-in strip for --sim: prints color changes."""
+
+    def __init__(self, n):
+        self.n = n
+        self.color = OFF
+
+    def fill(self, color):
+        self.color = tuple(color)
+
+    def show(self):
+        print(f"[NeoPixelDaemon] {self.color}")
+
+
+def _open_pixels(sim: bool):
+    if sim:
+        return _LogPixels(NEOPIXEL_COUNT)
+
+    import board
+    import neopixel
+    return neopixel.NeoPixel(
+        getattr(board, NEOPIXEL_PIN),
+        NEOPIXEL_COUNT,
+        brightness=NEOPIXEL_BRIGHTNESS,
+        auto_write=False,
+    )
+
+
+class NeoPixelDaemon:
+    def __init__(self, pixels, socket_path: str = NEOPIXEL_SOCKET,
+                 socket_group: str = NEOPIXEL_SOCKET_GROUP):
+        self.pixels = pixels
+        self.socket_path = socket_path
+        self.socket_group = socket_group
+        self._lock = threading.Lock()       # guards the strip
+        self._cmd_lock = threading.Lock()   # one command at a time (several clients)
+        self._sequence_stop = threading.Event()
+        self._sequence = None
+        self._running = False
+        self._current = None
+
+    # -------------------------------------------------------------
+    # Strip output
+    # -------------------------------------------------------------
+    def _show(self, color):
+        color = tuple(color) if color else OFF
+        with self._lock:
+            if color == self._current:
+                return      # strip already shows it; skip the refresh
+            self.pixels.fill(color)
+            self.pixels.show()
+            self._current = color
+
+    def _stop_sequence(self):
+        if self._sequence is not None:
+            self._sequence_stop.set()
+            self._sequence.join()
+            self._sequence = None
+
+    def _play(self, steps, duration, repeat):
+        end = None if duration is None else time.monotonic() + duration
+        deadline = time.monotonic()
+        played = 0
+
+        try:
+            while not self._sequence_stop.is_set():
+                if repeat is not None and played >= repeat:
+                    break
+                for color, seconds in steps:
+                    if end is not None and deadline >= end:
+                        return
+                    self._show(color)
+                    deadline += seconds
+                    remaining = deadline - time.monotonic()
+                    if remaining > 0 and self._sequence_stop.wait(remaining):
+                        return
+                played += 1
+        finally:
+            self._show(OFF)
+
+    # -------------------------------------------------------------
+    # Commands
+    # -------------------------------------------------------------
+    def handle(self, msg: dict) -> dict:
+        with self._cmd_lock:
+            return self._handle(msg)
+
+    def _handle(self, msg: dict) -> dict:
+        cmd = msg.get("cmd")
+
+        if cmd == "ping":
+            return {"ok": True, "sequence": self._sequence is not None and self._sequence.is_alive()}
+
+        # Every other command replaces whatever is playing
+        self._stop_sequence()
+
+        if cmd == "on":
+            self._show(msg.get("color") or NEOPIXEL_ALERT_COLOR)
+        elif cmd == "color":
+            self._show(msg["color"])
+        elif cmd == "off":
+            self._show(OFF)
+        elif cmd == "sequence":
+            steps = [(color, float(seconds)) for color, seconds in msg["steps"]]
+            if not steps:
+                return {"ok": False, "error": "sequence needs at least one step"}
+            if min(s for _, s in steps) < MIN_STEP_S:
+                return {"ok": False, "error": f"sequence steps must be at least {MIN_STEP_S} s"}
+            self._sequence_stop.clear()
+            self._sequence = threading.Thread(
+                target=self._play,
+                args=(steps, msg.get("duration"), msg.get("repeat")),
+                name="NeoPixelSequence",
+                daemon=True,
+            )
+            self._sequence.start()
+        else:
+            return {"ok": False, "error": f"unknown command {cmd!r}"}
+
+        return {"ok": True}
+
+    def _serve_connection(self, conn):
+        with conn, conn.makefile("rwb") as stream:
+            for line in stream:
+                if not line.strip():
+                    continue
+                try:
+                    reply = self.handle(json.loads(line))
+                except (ValueError, KeyError, TypeError) as e:
+                    reply = {"ok": False, "error": str(e)}
+                stream.write(json.dumps(reply).encode() + b"\n")
+                stream.flush()
+
+    def serve_forever(self):
+        # The daemon runs as root; PillSync connects through the socket's group
+        server = bind_group_socket(self.socket_path, self.socket_group, "[NeoPixelDaemon]")
+        server.listen(4)
+        self._running = True
+        print(f"[NeoPixelDaemon] Listening on {self.socket_path}")
+
+        try:
+            while self._running:
+                conn, _ = server.accept()
+                threading.Thread(
+                    target=self._serve_connection, args=(conn,), daemon=True
+                ).start()
+        finally:
+            server.close()
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+            self._stop_sequence()
+            self._show(OFF)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="PillSync NeoPixel helper daemon")
+    parser.add_argument("--socket", default=NEOPIXEL_SOCKET)
+    parser.add_argument("--group", default=NEOPIXEL_SOCKET_GROUP,
+                        help="group allowed to connect (socket mode 0o660)")
+    parser.add_argument("--sim", action="store_true", help="log colors instead of driving LEDs")
+    args = parser.parse_args(argv)
+
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+
+    daemon = NeoPixelDaemon(_open_pixels(args.sim), args.socket, args.group)
+    daemon.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -5,14 +5,37 @@ Piezo alarm driver for PillSyncOS.
 Wiring:
   Piezo positive -> GPIO12 (BCM)
   Piezo negative -> GND
+
+Alarm sounds are compiled once into schedules – lists of
+(freq, duty, duration) entries, duty 0 meaning silence – and played by
+one long-lived player. The PWM is started once and only retuned
+(ChangeFrequency / ChangeDutyCycle) per entry, and every entry ends on
+an absolute monotonic deadline, so the sweep has no start/stop gaps and
+a 30 s alarm does not drift.
+
+Backends (config.PIEZO_BACKEND):
+  "gpio"    – RPi.GPIO software PWM (default)
+  "pigpio"  – hardware PWM through the pigpiod daemon (GPIO12 is PWM0);
+              exact frequencies, falls back to "gpio" if pigpiod is down
 """
 
+import threading
 import time
+from functools import lru_cache
+
 import RPi.GPIO as GPIO
 
+from config import PIEZO_BACKEND
+
 PIEZO_PIN = 12  # BCM numbering (PWM-capable)
 _initialized = False
-_pwm = None
+_player = None
+_player_lock = threading.Lock()
+
+# Chirp sweep: 1500 → 2800 Hz in 8 tones, duty 80% → 95% (capped)
+SWEEP_START = 1500
+SWEEP_END = 2800
+SWEEP_STEPS = 8
 
 
 def _init_gpio():
@@ -36,93 +59,238 @@ def _init_gpio():
         raise
 
 
-def _play_tone(freq: int, duration: float, duty: float = 70.0):
+# -------------------------------------------------------------
+# Schedule compilation
+# -------------------------------------------------------------
+@lru_cache(maxsize=None)
+def compile_chirp(on_time: float = 0.22) -> tuple:
     """
-    Play a tone at the given frequency and duty cycle.
+    Louder but still soft medical-style chirp (the sweep only, no gap).
     Higher duty = louder output while maintaining tone integrity.
     """
-    global _pwm
-    _init_gpio()
+    step_size = (SWEEP_END - SWEEP_START) // SWEEP_STEPS
+    tone_length = on_time / SWEEP_STEPS
 
-    if _pwm is None:
-        _pwm = GPIO.PWM(PIEZO_PIN, freq)
-    else:
-        _pwm.ChangeFrequency(freq)
+    schedule = []
+    for i in range(SWEEP_STEPS):
+        freq = SWEEP_START + (i * step_size)
+        duty = min(80 + (i * 2.5), 95)   # safety cap
+        schedule.append((freq, duty, tone_length))
+    return tuple(schedule)
 
-    _pwm.start(duty)
-    time.sleep(duration)
-    _pwm.stop()
 
+@lru_cache(maxsize=None)
+def compile_alarm_group(
+    beeps_per_group: int = 2,
+    on_time: float = 0.22,
+    off_time: float = 0.12,
+    group_pause: float = 0.6,
+) -> tuple:
+    """One chirp group of alarm(): chirps with gaps, then the group pause."""
+    schedule = []
+    for _ in range(beeps_per_group):
+        schedule.extend(compile_chirp(on_time))
+        schedule.append((0, 0, off_time))
+    schedule.append((0, 0, group_pause))
+    return tuple(schedule)
 
-def _chirp(on_time=0.22, off_time=0.12):
-    """
-    Louder but still soft medical-style chirp.
-    Sweep: 1500 → 2800 Hz
-    Duty: 80% → 95% (capped)
-    """
-    _init_gpio()
 
-    sweep_start = 1500
-    sweep_end = 2800
-    steps = 8
-    step_size = (sweep_end - sweep_start) // steps
-    tone_length = on_time / steps
+# -------------------------------------------------------------
+# Backends
+# -------------------------------------------------------------
+class _GPIOPWM:
+    """RPi.GPIO software PWM, started once and retuned in place."""
+
+    def __init__(self):
+        _init_gpio()
+        self._pwm = None
+        self._freq = None
+
+    def set(self, freq, duty):
+        if not duty:
+            if self._pwm is not None:
+                self._pwm.ChangeDutyCycle(0)
+            return
+        if self._pwm is None:
+            self._pwm = GPIO.PWM(PIEZO_PIN, freq)
+            self._pwm.start(duty)
+        else:
+            if freq != self._freq:
+                self._pwm.ChangeFrequency(freq)
+            self._pwm.ChangeDutyCycle(duty)
+        self._freq = freq
+
+    def close(self):
+        if self._pwm is not None:
+            try:
+                self._pwm.stop()
+            except:
+                pass
+            self._pwm = None
+        try:
+            GPIO.output(PIEZO_PIN, GPIO.LOW)
+        except:
+            pass
+
+
+class _PigpioPWM:
+    """Hardware PWM via pigpiod (duty in millionths)."""
+
+    def __init__(self):
+        import pigpio
+        self._pi = pigpio.pi()
+        if not self._pi.connected:
+            raise OSError("pigpiod not running")
+
+    def set(self, freq, duty):
+        if not duty:
+            self._pi.hardware_PWM(PIEZO_PIN, 0, 0)
+        else:
+            self._pi.hardware_PWM(PIEZO_PIN, int(freq), int(duty * 10_000))
+
+    def close(self):
+        self._pi.hardware_PWM(PIEZO_PIN, 0, 0)
+        self._pi.stop()
+
+
+def _make_backend(name: str = PIEZO_BACKEND):
+    if name == "pigpio":
+        try:
+            return _PigpioPWM()
+        except Exception as e:
+            print(f"[Piezo] Hardware PWM unavailable ({e}); using RPi.GPIO")
+    return _GPIOPWM()
+
+
+# -------------------------------------------------------------
+# Player
+# -------------------------------------------------------------
+class SchedulePlayer:
+    def __init__(self, backend=None):
+        self.backend = backend or _make_backend()
+        self._lock = threading.Lock()
+        self.late_s = 0.0      # worst entry overrun seen (diagnostics)
+
+    def play(self, schedule, stop_event=None, until: float = None):
+        """
+        Play `schedule` once, ending each entry on a monotonic deadline.
 
-    for i in range(steps):
-        freq = sweep_start + (i * step_size)
+        Returns early (silenced) if `stop_event` is set; an entry is not
+        started if it would begin at or after monotonic time `until`.
+        Returns False if it was stopped / cut off.
+        """
+        with self._lock:
+            deadline = time.monotonic()
+            try:
+                for freq, duty, duration in schedule:
+                    if until is not None and deadline >= until:
+                        return False
+                    self.backend.set(freq, duty)
+                    deadline += duration
 
-        # Higher duty = louder. This increases SPL without harshness.
-        duty = 80 + (i * 2.5)
-        if duty > 95:
-            duty = 95  # safety cap
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.late_s = max(self.late_s, -remaining)
+                    elif stop_event is not None:
+                        if stop_event.wait(remaining):
+                            return False
+                    else:
+                        time.sleep(remaining)
+                return True
+            finally:
+                self.backend.set(0, 0)
 
-        _play_tone(freq, tone_length, duty=duty)
+    def silence(self):
+        self.backend.set(0, 0)
 
+    def close(self):
+        self.backend.close()
+
+
+def _get_player() -> SchedulePlayer:
+    global _player
+    with _player_lock:
+        if _player is None:
+            _player = SchedulePlayer()
+        return _player
+
+
+# -------------------------------------------------------------
+# Public API
+# -------------------------------------------------------------
+def _play_tone(freq: int, duration: float, duty: float = 70.0):
+    """Play a single tone (one-entry schedule)."""
+    _get_player().play(((freq, duty, duration),))
+
+
+def chirp_sweep(on_time=0.22):
+    """
+    One chirp sweep, no trailing gap.
+
+    Used by alarm_engine.AlarmEngine, which times the gaps itself.
+    """
+    _get_player().play(compile_chirp(on_time))
+
+
+def _chirp(on_time=0.22, off_time=0.12):
+    chirp_sweep(on_time)
     time.sleep(off_time)
 
 
+def silence():
+    """Stop any tone and drive the pin low."""
+    if _player is not None:
+        try:
+            _player.silence()
+        except:
+            pass
+    if _initialized:
+        try:
+            GPIO.output(PIEZO_PIN, GPIO.LOW)
+        except:
+            pass
+
+
 def alarm(
     duration: float = 30.0,
     beeps_per_group: int = 2,
     group_pause: float = 0.6,
+    stop_event=None,
 ):
     """
     Friendly medical-device alarm using blended tone/chirp pattern.
+    Blocks for `duration` (or until `stop_event` is set).
     """
-    _init_gpio()
-    start = time.time()
+    group = compile_alarm_group(beeps_per_group, group_pause=group_pause)
+    player = _get_player()
+    end = time.monotonic() + duration
 
     try:
-        while (time.time() - start) < duration:
-            for _ in range(beeps_per_group):
-                _chirp()
-
-            time.sleep(group_pause)
+        while time.monotonic() < end:
+            if not player.play(group, stop_event=stop_event, until=end):
+                break
 
     finally:
         # ensure silence
-        try:
-            GPIO.output(PIEZO_PIN, GPIO.LOW)
-        except:
-            pass
+        silence()
 
 
 def cleanup():
     """Cleanup GPIO when shutting down."""
-    global _initialized, _pwm
-    if _pwm is not None:
+    global _initialized, _player
+    if _player is not None:
         try:
-            _pwm.stop()
+            _player.close()
         except:
             pass
-        _pwm = None
+        _player = None
 
     if _initialized:
         try:
             GPIO.output(PIEZO_PIN, GPIO.LOW)
         except:
             pass
-        
+
         GPIO.cleanup(PIEZO_PIN)
         _initialized = False
 
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Carousel position journal for PillSyncOS.
+
+MotorArray records, for every motor:
+  • phase     – index into the half-step SEQ of the last energized pattern
+  • position  – half-steps from slot 0, modulo one carousel revolution
+  • state     – "idle" or "moving"
+
+The journal is written before every move (state = "moving") and again
+after it (state = "idle"). A motor still marked "moving" on startup was
+interrupted by a crash or power loss, so its position is unknown and it
+needs a full homing rotation. Idle motors resume exactly where they
+stopped and homing only has to turn the shortest way back to slot 0.
+
+Entries are keyed by wiring – expander address, port and nibble, e.g.
+"0x21/A4" – not by motor id. Motor ids depend on MOTORS_PER_EXPANDER
+(build_motor_map), so after a wiring change the same id can name a
+different carousel; a wiring key always names the same coils. Journals
+from before this (keyed by motor id) are ignored, which costs one full
+homing rotation.
+
+Writes are crash-safe: the JSON goes to a temp file which is fsync'ed
+and atomically renamed over the old journal.
+"""
+
+import json
+import os
+
+JOURNAL_PATH = "data/motor_positions.json"
+
+
+def wiring_key(cfg) -> str:
+    """Journal key of one motor_map entry: "0x20/A0", "0x21/B4", ..."""
+    return f"{cfg['addr']:#04x}/{cfg['port']}{cfg['shift']}"
+
+
+class PositionJournal:
+    def __init__(self, path: str = JOURNAL_PATH, motor_map=None):
+        """
+        :param motor_map: MotorArray.motor_map, translating motor ids to
+                          wiring keys
+        """
+        self.path = path
+        self.motor_map = motor_map or {}
+        self.entries = {}    # wiring key -> entry (also boards not present now)
+
+    def load(self) -> dict:
+        """Return {motor_id: entry}; an unreadable journal counts as empty."""
+        try:
+            with open(self.path, "r") as f:
+                raw = json.load(f)
+            if "wiring" not in raw and raw.get("motors"):
+                print(f"[PositionJournal] Ignoring motor-id keyed journal {self.path}; "
+                      f"homing required")
+            self.entries = dict(raw.get("wiring", {}))
+        except FileNotFoundError:
+            self.entries = {}
+        except (OSError, ValueError, AttributeError, TypeError) as e:
+            print(f"[PositionJournal] Ignoring unreadable journal {self.path}: {e}")
+            self.entries = {}
+
+        return {
+            mid: self.entries[wiring_key(cfg)]
+            for mid, cfg in self.motor_map.items()
+            if wiring_key(cfg) in self.entries
+        }
+
+    def record(self, motor_ids, phases, positions, state):
+        """Update the given motors and flush the whole journal to disk."""
+        for mid in motor_ids:
+            self.entries[wiring_key(self.motor_map[mid])] = {
+                "motor_id": mid,     # informational; the key is what counts
+                "phase": phases[mid],
+                "position": positions[mid],
+                "state": state,
+            }
+        self._write()
+
+    def _write(self):
+        directory = os.path.dirname(self.path) or "."
+        os.makedirs(directory, exist_ok=True)
+
+        tmp_path = self.path + ".tmp"
+        payload = {"wiring": dict(sorted(self.entries.items()))}
+
+        with open(tmp_path, "w") as f:
+            json.dump(payload, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+        # Make the rename itself durable
+        try:
+            dir_fd = os.open(directory, os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
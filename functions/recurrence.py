@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+"""
+Recurrence engine for PillSyncOS.
+
+Turns a prescription's free-text `frequency` plus its `time_of_day`
+into a dose schedule:
+
+    "Daily" / "Once a day" / "every day"        -> time_of_day, every day
+    "Twice a day" / "3 times a day" / "TID"     -> N doses from time_of_day,
+                                                   24/N hours apart or closer
+                                                   (see LAST_SPREAD_DOSE)
+    "Every 8 hours" / "q6h"                     -> every N hours from time_of_day
+    "Weekdays" / "Weekends" / "Mon, Wed, Fri"   -> those days at time_of_day
+    "Every 3 days" / "Every other day" / "Weekly"
+                                                -> every N days from `anchor`
+    "Every 2 weeks" / "Every other week"        -> every 7N days from `anchor`
+
+time_of_day may also list several times ("08:00, 20:00"); those are
+used as-is instead of spreading N doses over the day. Spread doses
+stay on the day of the first one: if 24/N hours apart would run past
+LAST_SPREAD_DOSE, they are packed evenly between the first time and
+LAST_SPREAD_DOSE instead of landing in the small hours (TID from 08:00
+is 08:00, 15:00, 22:00, not 08:00, 16:00, 00:00). If that packs them
+closer than MIN_DOSE_INTERVAL (TID from 21:00), the schedule is
+rejected: list each time instead. Day names are matched as whole
+words ("Mon", "Monday"), so "Monthly" is not a Monday.
+
+Anything else ("once a month", "every 30 hours", no time of day) is
+not recognized: recognized=False, `reason` says why, and the schedule
+has no doses at all rather than quietly becoming a daily alarm.
+add_prescription refuses such a prescription; older rows are flagged
+in the JSON feed and logged when their doses are generated.
+
+Every schedule is periodic, so it is stored as a period plus the sorted
+offsets of the doses inside one period. That offset table is the
+occurrence index: next_after(t) is one division and one bisect, and
+between(a, b) / iter_from(t) stream occurrences lazily in order.
+Parsed schedules are cached (recurrence_for), so the scheduler, the
+dashboard and the kiosk feed share one index per prescription.
+"""
+
+import re
+from bisect import bisect_left, bisect_right
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+
+MINUTES_PER_DAY = 24 * 60
+
+# Latest time of day a spread "N times a day" dose may fall (22:00)
+LAST_SPREAD_DOSE = 22 * 60
+
+# Spread doses closer together than this (minutes) are rejected
+MIN_DOSE_INTERVAL = 4 * 60
+
+# Weekly and every-N-days schedules count from here unless the
+# prescription has its own anchor (a Monday, so weekday offsets line up)
+EPOCH = datetime(2000, 1, 3)
+
+_WORD_NUMBERS = {
+    "once": 1, "one": 1, "twice": 2, "two": 2, "three": 3, "thrice": 3,
+    "four": 4, "five": 5, "six": 6, "other": 2,
+}
+
+_ABBREVIATIONS = {"qd": 1, "od": 1, "bid": 2, "tid": 3, "qid": 4}
+
+# Whole words only: "mon" / "mondays" but not "month"
+_DAY_NAMES = {
+    r"mon(?:days?)?": 0,
+    r"tue(?:s|sdays?)?": 1,
+    r"wed(?:nesdays?)?": 2,
+    r"thu(?:r|rs|rsdays?)?": 3,
+    r"fri(?:days?)?": 4,
+    r"sat(?:urdays?)?": 5,
+    r"sun(?:days?)?": 6,
+}
+
+
+class Recurrence:
+    def __init__(self, period: int, offsets, anchor: datetime, spec: str = "",
+                 recognized: bool = True, reason: str = None):
+        """
+        :param period: schedule period in minutes
+        :param offsets: dose offsets (minutes) inside one period
+        :param anchor: start of period 0
+        :param reason: why the schedule was not recognized (recognized=False)
+        """
+        self.period = period
+        self.offsets = tuple(sorted(set(o % period for o in offsets)))
+        self.anchor = anchor
+        self.spec = spec
+        self.recognized = recognized
+        self.reason = reason
+
+    def __repr__(self):
+        return (f"Recurrence({self.spec!r}, period={self.period} min, "
+                f"{len(self.offsets)} doses/period)")
+
+    # -------------------------------------------------------------
+    # Index
+    # -------------------------------------------------------------
+    def _locate(self, t: datetime, inclusive: bool):
+        """(period number, offset index) of the first dose at/after t."""
+        minutes = (t - self.anchor) / timedelta(minutes=1)
+        n, into = divmod(minutes, self.period)
+        n = int(n)
+        i = (bisect_left if inclusive else bisect_right)(self.offsets, into)
+        if i == len(self.offsets):
+            n, i = n + 1, 0
+        return n, i
+
+    def _at(self, n: int, i: int) -> datetime:
+        return self.anchor + timedelta(minutes=n * self.period + self.offsets[i])
+
+    def next_after(self, t: datetime, inclusive: bool = False):
+        """First dose after t (at or after t with inclusive=True)."""
+        if not self.offsets:
+            return None
+        return self._at(*self._locate(t, inclusive))
+
+    def iter_from(self, t: datetime, inclusive: bool = True):
+        """Lazy, sorted, endless stream of doses from t."""
+        if not self.offsets:
+            return
+        n, i = self._locate(t, inclusive)
+        while True:
+            yield self._at(n, i)
+            i += 1
+            if i == len(self.offsets):
+                n, i = n + 1, 0
+
+    def between(self, start: datetime, end: datetime) -> list:
+        """Doses in [start, end)."""
+        out = []
+        for due in self.iter_from(start):
+            if due >= end:
+                break
+            out.append(due)
+        return out
+
+    def on(self, day: date) -> list:
+        start = datetime.combine(day, datetime.min.time())
+        return self.between(start, start + timedelta(days=1))
+
+
+# -------------------------------------------------------------
+# Parsing
+# -------------------------------------------------------------
+def parse_times(time_of_day) -> list:
+    """"08:00" or "08:00, 20:00" -> minutes of day; bad entries skipped."""
+    minutes = []
+    for part in re.split(r"[,;/ ]+", (time_of_day or "").strip()):
+        if not part:
+            continue
+        try:
+            t = datetime.strptime(part, "%H:%M")
+        except ValueError:
+            continue
+        minutes.append(t.hour * 60 + t.minute)
+    return sorted(set(minutes))
+
+
+def _count(text: str):
+    """Leading number in "3", "three", "twice" ... or None."""
+    if text.isdigit():
+        return int(text)
+    return _WORD_NUMBERS.get(text)
+
+
+def parse(frequency, time_of_day, anchor: datetime = None) -> Recurrence:
+    """Build the Recurrence for one prescription (see module docstring)."""
+    spec = (frequency or "").strip().lower()
+    times = parse_times(time_of_day)
+    first = times[0] if times else None
+    anchor_day = datetime.combine((anchor or EPOCH).date(), datetime.min.time())
+
+    def daily(offsets):
+        return Recurrence(MINUTES_PER_DAY, offsets, EPOCH, spec)
+
+    def unrecognized(reason):
+        # No doses: an unknown schedule must not turn into a daily alarm
+        return Recurrence(MINUTES_PER_DAY, [], EPOCH, spec, recognized=False, reason=reason)
+
+    if first is None:
+        return unrecognized("no valid time of day (HH:MM)")
+
+    # Every N hours
+    m = re.search(r"(?:every\s+(\w+)\s+hours?|every\s+hour|q(\d+)h)\b", spec)
+    if m:
+        n = _count(m.group(1) or m.group(2) or "1")
+        if n and 0 < n <= 24:
+            return Recurrence(n * 60, [0], anchor_day + timedelta(minutes=first), spec)
+        return unrecognized("every N hours needs N between 1 and 24")
+
+    # Particular days of the week
+    days = None
+    if "weekday" in spec:
+        days = [0, 1, 2, 3, 4]
+    elif "weekend" in spec:
+        days = [5, 6]
+    else:
+        named = [d for name, d in _DAY_NAMES.items() if re.search(rf"\b{name}\b", spec)]
+        if named:
+            days = named
+    if days:
+        return Recurrence(
+            7 * MINUTES_PER_DAY,
+            [d * MINUTES_PER_DAY + t for d in days for t in times],
+            EPOCH, spec,
+        )
+
+    # Every N weeks / every N days / weekly
+    m = re.search(r"every\s+(\w+)\s+weeks?\b|\b(biweekly|fortnightly)\b", spec)
+    if m:
+        n = 2 if m.group(2) else _count(m.group(1))
+        if n and n > 0:
+            return Recurrence(n * 7 * MINUTES_PER_DAY, times, anchor_day, spec)
+    m = re.search(r"every\s+(\w+)\s+days?\b|\b(weekly|once a week|every week)\b", spec)
+    if m:
+        n = 7 if m.group(2) else _count(m.group(1))
+        if n and n > 0:
+            return Recurrence(n * MINUTES_PER_DAY, times, anchor_day, spec)
+
+    # N times a day (explicit times win over spreading)
+    m = re.search(
+        r"\b(once|twice|thrice|\w+(?=\s*x\b)|\w+(?=\s+times?\b))\s*(?:x|times?)?\s*"
+        r"(?:a|per|/|each)?\s*(?:day|daily)\b",
+        spec,
+    )
+    n = _count(m.group(1)) if m else None
+    if n is None:
+        n = next((v for k, v in _ABBREVIATIONS.items() if re.search(rf"\b{k}\b", spec)), None)
+    if n is not None and n > 0:
+        if len(times) > 1:
+            return daily(times)
+        if n == 1:
+            return daily(times)
+        step = min(MINUTES_PER_DAY / n, (LAST_SPREAD_DOSE - first) / (n - 1))
+        if step < MIN_DOSE_INTERVAL:
+            return unrecognized(
+                f"{n} doses from {time_of_day.strip()} would be less than "
+                f"{MIN_DOSE_INTERVAL // 60} hours apart; list each time instead"
+            )
+        return daily([round(first + k * step) for k in range(n)])
+
+    if not spec or re.search(r"\b(daily|every\s*day|a day)\b", spec):
+        return daily(times)
+
+    return unrecognized(f"frequency {frequency!r} is not a schedule PillSync understands")
+
+
+@lru_cache(maxsize=256)
+def recurrence_for(frequency, time_of_day, anchor: datetime = None) -> Recurrence:
+    """Cached parse(); prescriptions change rarely, lookups happen every tick."""
+    return parse(frequency, time_of_day, anchor)
+
+
+def anchor_of(prescription):
+    """Anchor for every-N-days schedules: the prescription's created_at, if any."""
+    try:
+        created = prescription["created_at"]
+    except (KeyError, IndexError):
+        return None
+    if not created:
+        return None
+    try:
+        return datetime.fromisoformat(str(created)).replace(hour=0, minute=0, second=0, microsecond=0)
+    except ValueError:
+        return None
+
+
+def for_prescription(prescription) -> Recurrence:
+    """Recurrence of a prescriptions row (sqlite3.Row or dict)."""
+    return recurrence_for(
+        prescription["frequency"], prescription["time_of_day"], anchor_of(prescription)
+    )
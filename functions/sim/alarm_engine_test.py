@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+AlarmEngine checks without hardware (no piezo / NeoPixel outputs).
+
+Covers the clear() → trigger() race: a dispense clears the alarm
+with clear(wait=0) from the motion thread, and the next dose comes due
+before the worker has wound the old alarm down. The new dose must
+still sound as its own episode.
+
+Run from the repo root:
+
+    python3 -m functions.sim.alarm_engine_test
+"""
+
+import time
+
+from functions.alarm_engine import AlarmEngine
+
+
+def _engine():
+    engine = AlarmEngine()
+    engine.start()
+    return engine
+
+
+def _wait_for(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return predicate()
+
+
+def test_clear_stops_alarm():
+    engine = _engine()
+    try:
+        engine.trigger(duration=5.0, doses=[{"prescription_id": 1, "user_id": 1}])
+        assert engine.status()["active"]
+        assert engine.clear(wait=1.0)
+        assert not engine.status()["active"]
+    finally:
+        engine.shutdown()
+
+
+def test_trigger_right_after_clear_sounds():
+    engine = _engine()
+    try:
+        engine.trigger(duration=5.0, doses=[{"prescription_id": 1, "user_id": 1}])
+        assert _wait_for(lambda: engine.chirps > 0)
+
+        engine.clear(wait=0)
+        engine.trigger(duration=5.0, doses=[{"prescription_id": 2, "user_id": 1}])
+
+        # Give the worker time to act on the (taken back) stop
+        time.sleep(0.5)
+        status = engine.status()
+        assert status["active"], status
+        assert status["prescription_ids"] == [2], status
+        assert status["episodes"] == 2, status
+
+        chirps = engine.chirps
+        assert _wait_for(lambda: engine.chirps > chirps), "new alarm is not chirping"
+    finally:
+        engine.shutdown()
+
+
+def test_trigger_after_worker_stopped_starts_new_episode():
+    engine = _engine()
+    try:
+        engine.trigger(duration=5.0, doses=[{"prescription_id": 1, "user_id": 1}])
+        engine.clear(wait=1.0)
+        engine.trigger(duration=5.0, doses=[{"prescription_id": 2, "user_id": 1}])
+        assert _wait_for(lambda: engine.status()["active"])
+        assert engine.status()["prescription_ids"] == [2]
+    finally:
+        engine.shutdown()
+
+
+def main():
+    for test in (
+        test_clear_stops_alarm,
+        test_trigger_right_after_clear_sounds,
+        test_trigger_after_worker_stopped_starts_new_episode,
+    ):
+        test()
+        print(f"[AlarmEngineTest] {test.__name__}: OK")
+
+
+if __name__ == "__main__":
+    main()
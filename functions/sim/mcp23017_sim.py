@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+In-memory MCP23017 simulator for PillSyncOS.
+
+SimSMBus is a drop-in stand-in for smbus2.SMBus that MotorArray can use
+on a dev box or in benchmarks:
+
+    from functions.sim.mcp23017_sim import SimSMBus
+    bus = SimSMBus(addrs=(0x20, 0x21), latency=0.0002)
+    ma = MotorArray(bus=bus)
+
+Each simulated expander keeps its full register file (IODIR, IOCON,
+OLAT, ...) with the chip's address-pointer behaviour:
+  • BANK = 0 register layout
+  • sequential writes auto-increment the pointer (IOCON.SEQOP = 0)
+  • byte mode (IOCON.SEQOP = 1) with BANK = 0 toggles the pointer
+    within its A/B register pair (OLATA → OLATB → OLATA ...), as the
+    chip does; with BANK = 1 it stays on the same register (the BANK = 1
+    address map itself is not modelled)
+
+Every transaction is logged with a monotonic_ns timestamp, and an
+optional per-transaction latency (plus per-byte time) is injected so
+timing can be measured off-device. The latency is a busy-wait (like a
+blocking ioctl, it burns wall time on the calling thread); the total is
+kept in busy_ns so CPU figures can be corrected for it. Unknown
+addresses NACK with the same OSError a real bus raises.
+"""
+
+import errno
+import time
+
+NUM_REGISTERS = 0x16
+IOCON = 0x0A
+IOCON_SEQOP = 0x20
+IOCON_BANK = 0x80
+
+# Power-on defaults: IODIRA/IODIRB = 0xFF (all inputs), the rest 0x00
+_POR_STATE = [0xFF, 0xFF] + [0x00] * (NUM_REGISTERS - 2)
+
+
+class SimMCP23017:
+    def __init__(self, addr):
+        self.addr = addr
+        self.regs = list(_POR_STATE)
+
+    def _next_reg(self, reg):
+        iocon = self.regs[IOCON]
+        if iocon & IOCON_SEQOP:
+            if iocon & IOCON_BANK:
+                return reg
+            return reg ^ 1      # BANK = 0: A/B registers are adjacent pairs
+        return (reg + 1) % NUM_REGISTERS
+
+    def write(self, reg, data):
+        for value in data:
+            self.regs[reg] = value & 0xFF
+            reg = self._next_reg(reg)
+
+    def read(self, reg, length):
+        out = []
+        for _ in range(length):
+            out.append(self.regs[reg])
+            reg = self._next_reg(reg)
+        return out
+
+
+class I2CTransaction:
+    __slots__ = ("t_ns", "addr", "op", "reg", "data")
+
+    def __init__(self, t_ns, addr, op, reg, data):
+        self.t_ns = t_ns
+        self.addr = addr
+        self.op = op
+        self.reg = reg
+        self.data = data
+
+    def __repr__(self):
+        return f"I2CTransaction({self.op} @0x{self.addr:02x} reg={self.reg} data={self.data})"
+
+
+class SimSMBus:
+    def __init__(
+        self,
+        addrs=(0x20,),
+        latency: float = 0.0,
+        byte_time: float = 0.0,
+        keep_log: bool = True,
+    ):
+        """
+        :param addrs: expander addresses that ACK
+        :param latency: fixed seconds per transaction (syscall + start/stop)
+        :param byte_time: extra seconds per data byte (≈ 9 bits / SCL rate)
+        :param keep_log: record every transaction in self.log
+        """
+        self.chips = {addr: SimMCP23017(addr) for addr in addrs}
+        self.latency = latency
+        self.byte_time = byte_time
+        self.keep_log = keep_log
+        self.log = []
+        self.counts = {}
+        self.bytes_sent = 0
+        self.busy_ns = 0
+        self.closed = False
+
+    # -------------------------------------------------------------
+    # Internals
+    # -------------------------------------------------------------
+    def _chip(self, addr):
+        chip = self.chips.get(addr)
+        if chip is None:
+            raise OSError(errno.EREMOTEIO, "Remote I/O error")
+        return chip
+
+    def _transaction(self, addr, op, reg, data):
+        nbytes = len(data) + (0 if reg is None else 1)
+        cost = self.latency + self.byte_time * nbytes
+        if cost > 0:
+            start = time.monotonic_ns()
+            end = start + int(cost * 1e9)
+            while time.monotonic_ns() < end:
+                pass
+            self.busy_ns += time.monotonic_ns() - start
+
+        self.counts[op] = self.counts.get(op, 0) + 1
+        self.bytes_sent += nbytes
+        if self.keep_log:
+            self.log.append(I2CTransaction(time.monotonic_ns(), addr, op, reg, tuple(data)))
+
+    # -------------------------------------------------------------
+    # smbus2.SMBus subset used by PillSync
+    # -------------------------------------------------------------
+    def write_byte(self, addr, value):
+        self._transaction(addr, "write_byte", None, [value])
+        self._chip(addr)
+
+    def write_byte_data(self, addr, reg, value):
+        self._transaction(addr, "write_byte_data", reg, [value])
+        self._chip(addr).write(reg, [value])
+
+    def write_i2c_block_data(self, addr, reg, data):
+        self._transaction(addr, "write_i2c_block_data", reg, list(data))
+        self._chip(addr).write(reg, data)
+
+    def i2c_rdwr(self, *msgs):
+        """Plain I2C writes: first byte is the register, the rest is data."""
+        for msg in msgs:
+            payload = list(msg)
+            self._transaction(msg.addr, "i2c_rdwr", payload[0], payload[1:])
+            self._chip(msg.addr).write(payload[0], payload[1:])
+
+    def read_byte_data(self, addr, reg):
+        self._transaction(addr, "read_byte_data", reg, [])
+        return self._chip(addr).read(reg, 1)[0]
+
+    def read_i2c_block_data(self, addr, reg, length):
+        self._transaction(addr, "read_i2c_block_data", reg, [])
+        return self._chip(addr).read(reg, length)
+
+    def close(self):
+        self.closed = True
+
+    # -------------------------------------------------------------
+    # Inspection helpers
+    # -------------------------------------------------------------
+    def olat(self, addr, port):
+        return self.chips[addr].regs[0x14 if port == "A" else 0x15]
+
+    def transactions(self) -> int:
+        return sum(self.counts.values())
+
+    def reset_stats(self):
+        self.log = []
+        self.counts = {}
+        self.bytes_sent = 0
+        self.busy_ns = 0
+
+    def stats(self) -> dict:
+        return {
+            "transactions": self.transactions(),
+            "by_op": dict(self.counts),
+            "bytes_sent": self.bytes_sent,
+            "busy_s": self.busy_ns / 1e9,
+        }
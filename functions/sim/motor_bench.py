@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Motor stepping micro-benchmarks for PillSyncOS.
+
+Drives the real MotorArray stepping loop against the in-memory
+MCP23017 model (mcp23017_sim.SimSMBus) with realistic I2C latency and
+reports, per case:
+
+  • achieved half-step rate vs. the requested one
+  • step interval / lateness percentiles (from StepTimingStats)
+  • I2C transactions and bytes per half-step
+  • CPU time (process_time), with the simulator's busy-wait removed
+
+Run from the repo root:
+
+    python3 -m functions.sim.motor_bench                 # JSON to stdout
+    python3 -m functions.sim.motor_bench --out bench.json
+    python3 -m functions.sim.motor_bench --case ramped --whole-steps 558
+
+Compare the JSON of two commits to spot regressions.
+"""
+
+import argparse
+import contextlib
+import json
+import platform
+import subprocess
+import sys
+import time
+
+from functions.motor_array import MotorArray, HALFSTEPS_PER_WHOLESTEP
+from functions.sim.mcp23017_sim import SimSMBus
+
+# Defaults model a Pi on a 100 kHz bus: ~50 µs syscall overhead plus
+# 9 SCL clocks per byte on the wire.
+DEFAULT_SCL_HZ = 100_000
+DEFAULT_SYSCALL_LATENCY = 50e-6
+
+
+def _case_constant(ma, whole_steps):
+    ma.step_motor(1, whole_steps=whole_steps, delay=0.003)
+    return [1]
+
+
+def _case_ramped(ma, whole_steps):
+    ma.step_motor(1, whole_steps=whole_steps, profile="fast")
+    return [1]
+
+
+def _case_multi(ma, whole_steps):
+    motor_ids = [mid for mid in (1, 2, 3) if mid in ma.motor_map]
+    ma.step_motors(motor_ids, whole_steps=whole_steps, delay=0.003)
+    return motor_ids
+
+
+def _case_max_rate(ma, whole_steps):
+    ma.step_motor(1, whole_steps=whole_steps, delay=0.0)
+    return [1]
+
+
+def _case_burst(ma, whole_steps):
+    ma.step_motor(1, whole_steps=whole_steps, delay=0.003, burst=True)
+    return [1]
+
+
+CASES = {
+    "constant": _case_constant,
+    "ramped": _case_ramped,
+    "multi": _case_multi,
+    "max_rate": _case_max_rate,
+    "burst": _case_burst,
+}
+
+
+def run_case(name, whole_steps, scl_hz, syscall_latency, addrs=(0x20, 0x21)) -> dict:
+    bus = SimSMBus(
+        addrs=addrs,
+        latency=syscall_latency,
+        byte_time=9.0 / scl_hz,
+        keep_log=False,
+    )
+    # Keep MotorArray's startup banner out of the JSON on stdout
+    with contextlib.redirect_stdout(sys.stderr):
+        ma = MotorArray(bus=bus, journal_path=None, detect_cache_path=None, bus_hz=scl_hz)
+    bus.reset_stats()
+
+    cpu_start = time.process_time()
+    motor_ids = CASES[name](ma, whole_steps)
+    cpu_s = time.process_time() - cpu_start
+
+    timing = ma.last_move_stats
+    halfsteps = whole_steps * HALFSTEPS_PER_WHOLESTEP
+    elapsed = timing["elapsed_s"] or 0.0
+    sim = bus.stats()
+
+    nominal_ms = timing["nominal_interval_ms"]
+    return {
+        "motors": motor_ids,
+        "half_steps": halfsteps,
+        "elapsed_s": elapsed,
+        "requested_rate_hz": (1000.0 / nominal_ms) if nominal_ms else None,
+        "achieved_rate_hz": (halfsteps / elapsed) if elapsed else None,
+        "timing": timing,
+        "i2c_transactions": sim["transactions"],
+        "i2c_ops_per_step": sim["transactions"] / halfsteps,
+        "i2c_bytes_per_step": sim["bytes_sent"] / halfsteps,
+        "cpu_s": cpu_s,
+        "cpu_s_excl_bus": max(0.0, cpu_s - sim["busy_s"]),
+        "cpu_us_per_step": max(0.0, cpu_s - sim["busy_s"]) / halfsteps * 1e6,
+    }
+
+
+def _git_commit():
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, timeout=5,
+        )
+        return out.stdout.strip() or None
+    except Exception:
+        return None
+
+
+def run(cases=None, whole_steps=200, scl_hz=DEFAULT_SCL_HZ,
+        syscall_latency=DEFAULT_SYSCALL_LATENCY) -> dict:
+    cases = cases or list(CASES)
+    return {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "whole_steps": whole_steps,
+            "scl_hz": scl_hz,
+            "syscall_latency_s": syscall_latency,
+        },
+        "cases": {
+            name: run_case(name, whole_steps, scl_hz, syscall_latency)
+            for name in cases
+        },
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="PillSync motor stepping benchmarks")
+    parser.add_argument("--case", action="append", choices=sorted(CASES),
+                        help="case to run (repeatable; default: all)")
+    parser.add_argument("--whole-steps", type=int, default=200)
+    parser.add_argument("--scl-hz", type=int, default=DEFAULT_SCL_HZ)
+    parser.add_argument("--syscall-latency", type=float, default=DEFAULT_SYSCALL_LATENCY)
+    parser.add_argument("--out", help="write JSON here instead of stdout")
+    args = parser.parse_args(argv)
+
+    results = run(args.case, args.whole_steps, args.scl_hz, args.syscall_latency)
+    text = json.dumps(results, indent=2)
+
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+        for name, case in results["cases"].items():
+            late = case["timing"]["p99_lateness_ms"] or 0.0   # None for burst
+            print(
+                f"{name:>9}: {case['achieved_rate_hz']:.0f} steps/s, "
+                f"p99 late {late:.3f} ms, "
+                f"{case['i2c_ops_per_step']:.2f} I2C ops/step, "
+                f"{case['cpu_us_per_step']:.1f} µs CPU/step",
+                file=sys.stderr,
+            )
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
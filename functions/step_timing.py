@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Step timing statistics for PillSyncOS motor moves.
+
+MotorArray schedules every half-step against an absolute
+time.monotonic_ns() deadline instead of sleeping a fixed delay after
+each write. StepTimingStats records what actually happened:
+
+ • interval between consecutive coil writes (min / mean / max /
+   p50 / p90 / p99)
+ • lateness of each write against its scheduled deadline (jitter)
+ • overruns  – deadlines that had already passed when we got to them
+ • resyncs   – overruns so late that the schedule was reset instead of
+               catching up (bursting steps would stall the motor)
+"""
+
+import time
+
+
+class StepTimingStats:
+    def __init__(self, motor_ids=None):
+        self.motor_ids = list(motor_ids or [])
+        self.intervals_ns = []
+        self.lateness_ns = []
+        self.nominal_ns = 0
+        self.overruns = 0
+        self.resyncs = 0
+        self.started_ns = None
+        self.finished_ns = None
+        self._last_write_ns = None
+
+    def record_write(self, now_ns: int, scheduled_ns: int = None):
+        if scheduled_ns is not None:
+            self.lateness_ns.append(max(0, now_ns - scheduled_ns))
+        if self.started_ns is None:
+            self.started_ns = now_ns
+        if self._last_write_ns is not None:
+            self.intervals_ns.append(now_ns - self._last_write_ns)
+        self._last_write_ns = now_ns
+
+    def finish(self):
+        self.finished_ns = time.monotonic_ns()
+
+    @staticmethod
+    def _percentile(sorted_vals, pct):
+        if not sorted_vals:
+            return None
+        k = min(len(sorted_vals) - 1, int(round(pct / 100.0 * (len(sorted_vals) - 1))))
+        return sorted_vals[k]
+
+    def summary(self) -> dict:
+        """Timing summary in milliseconds (None when no intervals were seen)."""
+        vals = sorted(self.intervals_ns)
+        late = sorted(self.lateness_ns)
+        steps = len(vals) + (1 if self._last_write_ns is not None else 0)
+
+        def ms(ns):
+            return None if ns is None else ns / 1e6
+
+        elapsed = None
+        if self.started_ns is not None and self.finished_ns is not None:
+            elapsed = (self.finished_ns - self.started_ns) / 1e9
+
+        return {
+            "motor_ids": self.motor_ids,
+            "steps": steps,
+            "nominal_interval_ms": ms(self.nominal_ns / steps) if steps else None,
+            "min_interval_ms": ms(vals[0]) if vals else None,
+            "mean_interval_ms": ms(sum(vals) / len(vals)) if vals else None,
+            "max_interval_ms": ms(vals[-1]) if vals else None,
+            "p50_interval_ms": ms(self._percentile(vals, 50)),
+            "p90_interval_ms": ms(self._percentile(vals, 90)),
+            "p99_interval_ms": ms(self._percentile(vals, 99)),
+            "p50_lateness_ms": ms(self._percentile(late, 50)),
+            "p99_lateness_ms": ms(self._percentile(late, 99)),
+            "max_lateness_ms": ms(late[-1]) if late else None,
+            "overruns": self.overruns,
+            "resyncs": self.resyncs,
+            "elapsed_s": elapsed,
+        }
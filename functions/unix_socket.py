@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+Group-shared Unix sockets for PillSyncOS helper processes.
+
+The NeoPixel daemon (root) and the motor driver (root under sudo, or
+the web app's own user when it spawns one) listen in /run/pillsync,
+not world-writable /tmp. bind_group_socket() creates that directory
+(0o770) and the socket (0o660) owned by a configurable group, so only
+members of the group – the user PillSync runs as – can connect,
+whichever user started the helper.
+"""
+
+import grp
+import os
+import socket
+
+
+def group_id(group, log_prefix="[Socket]") -> int:
+    """gid of `group`, or -1 (leave the group alone) if unset / unknown."""
+    if group is None:
+        return -1
+    try:
+        return grp.getgrnam(group).gr_gid
+    except KeyError:
+        print(f"{log_prefix} Group {group!r} not found; socket stays owner-only")
+        return -1
+
+
+def _share(path, gid, mode, log_prefix):
+    try:
+        os.chown(path, -1, gid)
+    except OSError as e:
+        print(f"{log_prefix} Could not give {path} to group {gid}: {e}")
+    os.chmod(path, mode)
+
+
+def bind_group_socket(path: str, group=None, log_prefix="[Socket]") -> socket.socket:
+    """Bound (not yet listening) AF_UNIX socket at `path`, 0o660 for `group`."""
+    gid = group_id(group, log_prefix)
+
+    directory = os.path.dirname(path)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory, exist_ok=True)
+        # makedirs' mode is filtered by the umask; set it explicitly
+        _share(directory, gid, 0o770, log_prefix)
+
+    if os.path.exists(path):
+        os.unlink(path)
+
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(path)
+    _share(path, gid, 0o660, log_prefix)
+    return server